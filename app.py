@@ -1,27 +1,34 @@
 """app.py: render and route to webpages"""
 
 import os
-import bcrypt
 import logging
 from dotenv import load_dotenv
+from markupsafe import Markup
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify
-from db.server import init_database
+from db.server import init_database, engine, db_max_overflow, close_request_session, commit_request_session, rollback_request_session
+from db.pool import pool_status as db_pool_status
 import db.query as query
+import db.async_query as async_query
+from db.catalog import catalog
 from db import schema
+from session_store import create_session_store, session_ttl
+from passwords import hash_password, check_password, PasswordHasherBusy
+from log_setup import configure_logging, tail_log
+from metrics import init_metrics, metrics_allowed
+from query_audit import init_query_audit
+from assets import init_assets
+from fragment_cache import init_fragment_cache, fragments, personalize, split_owner_blocks
+from compression import init_compression
+from warmup import init_warmup
 
 # load environment variables from .env
 load_dotenv()
 
-#create cache for the user
-userCache = {}
+# logged in users, looked up by the token in the userloggedin cookie
+sessions = create_session_store()
 
-folderPath = "logs"
-os.makedirs(folderPath, exist_ok = True)
-
-# configure logging
-logging.basicConfig(
-    filename="logs/log.txt", level=logging.INFO, filemode="a", format="%(asctime)s [%(levelname)s] %(message)s"
-)
+# configure logging: records are queued here and written to logs/log.txt by a background thread
+configure_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +42,9 @@ db_owner = os.getenv('db_owner')
 db_pass = os.getenv('db_pass')
 db_url = f"postgresql://{db_owner}:{db_pass}@{db_host}:{db_port}/{db_name}"
 
+# number of users shown per page of search results
+SEARCH_PAGE_SIZE = 20
+
 def create_app():
     """Create Flask application and connect to your DB"""
     # create flask app
@@ -51,6 +61,22 @@ def create_app():
             print("Failed to initialize database. Exiting.")
             exit(1)
 
+    # one database session per request, committed before its response is sent
+    app.after_request(commit_request_session)
+    app.teardown_request(rollback_request_session)
+    # per-route latency and SQL metrics, served at /metrics
+    init_metrics(app)
+    # flag N+1 queries and routes over their statement budget (tests and debug)
+    init_query_audit(app)
+    # fingerprinted, precompressed static files (python assets.py) and their template helpers
+    init_assets(app)
+    # owner_only for templates whose rendered fragments are cached across viewers
+    init_fragment_cache(app)
+    # gzip/brotli responses for clients that accept them, streamed chunk by chunk
+    init_compression(app)
+    # templates compiled (bytecode cached on disk) and pool connections opened before the first request
+    init_warmup(app)
+
     # ===============================================================
     # routes
     # ===============================================================
@@ -82,44 +108,49 @@ def create_app():
                 # validate first name
                 if not firstName.isalpha() or len(firstName) < 2:
                     error = "First name can only contain letters and must be at least two characters."
-                    logger.warning(f"Invalid first name attempt: {firstName}")
+                    logger.warning("Invalid first name attempt: %s", firstName)
                     return render_template('signup.html', error=error)
                 
                 # validate last name
                 if not lastName.isalpha() or len(lastName) < 2:
                     error = "Last name can only contain letters and must be at least two characters."
-                    logger.warning(f"Invalid last name attempt: {lastName}")
+                    logger.warning("Invalid last name attempt: %s", lastName)
                     return render_template('signup.html', error=error)
                 
                 # validate user name
                 if not len(userName) >= 2:
                     error = "User name has to be at least two characters."
-                    logger.warning(f"Invalid Username attempt: {error}")
+                    logger.warning("Invalid Username attempt: %s", error)
                     return render_template('signup.html', error=error)
                 
                 # validate password
                 if not len(password) >= 8:
                     error = "Password has to be at least eight characters."
-                    logger.warning(f"Invalid password attempt: {error}")
+                    logger.warning("Invalid password attempt: %s", error)
                     return render_template('signup.html', error=error)
                 
-                # hash and salt password 
-                salt = bcrypt.gensalt()
-                hashedPassword = bcrypt.hashpw(password.encode('utf-8'), salt)
+                # hash and salt password on the password hashing threads
+                hashedPassword = hash_password(password)
 
                 # create a user object with form info
                 user = schema.User(FName=firstName,
                             LName=lastName,
                             UName=userName,
                             Email=email,
-                            PWord=hashedPassword.decode('utf8'))
+                            PWord=hashedPassword)
                 
                 # insert the user into the database
-                query.insert(user)
+                if not query.insert(user):
+                    error = "That email or user name is already in use."
+                    logger.warning("Signup with an email or user name already in use: %s", email)
+                    return render_template('signup.html', error=error)
 
                 # go to login page
                 return redirect(url_for('login'))
-            
+
+            except PasswordHasherBusy:
+                logger.warning("Signup turned away, password hashing queue is full")
+                return render_template('signup.html', error="The site is busy right now, please try again in a moment."), 503
             except Exception as e:
                 # Print the error for debugging and redirect back to signup
                 print("Error inserting user: ", e)
@@ -144,23 +175,29 @@ def create_app():
                 error = f"failed login attempt for: {email}"
 
                 if not user:
-                    logger.warning(f"Login attempt with non-existent email: {email}")
+                    logger.warning("Login attempt with non-existent email: %s", email)
                     return render_template('login.html', error=error)
                 
-                if bcrypt.checkpw(password.encode('utf-8'), user.PWord.encode('utf-8')):
-                    logger.info(f"Successful login: {email}")
-                    loggedinuser = str(user.UserID)
-                    userCache[loggedinuser] = user
+                matches, new_hash = check_password(password, user.PWord)
+                if matches:
+                    logger.info("Successful login: %s", email)
+                    # the stored hash used an old bcrypt cost; swap in one made at the current cost
+                    if new_hash:
+                        query.updatePassword(user.UserID, new_hash)
+                    token = sessions.create(user)
                     response = redirect(url_for('my_feed'))
-                    response.set_cookie('userloggedin', loggedinuser)
+                    response.set_cookie('userloggedin', token, max_age=session_ttl, httponly=True, samesite='Lax')
                     return response
                 
                 else:
-                    logger.warning(f"Login attempted with incorrect password")
+                    logger.warning("Login attempted with incorrect password")
                     return render_template('login.html', error=error)
-                
+
+            except PasswordHasherBusy:
+                logger.warning("Login turned away, password hashing queue is full")
+                return render_template('login.html', error="The site is busy right now, please try again in a moment."), 503
             except Exception as e:
-                logger.error(f"An error occurred during login: {e}")
+                logger.error("An error occurred during login: %s", e)
                 return render_template('login.html')
         elif request.method == 'GET':
             return render_template('login.html')
@@ -191,14 +228,11 @@ def create_app():
         try:
             userid = user.UserID
             username = user.UName
-            watched = query.getTitles(userid, "watched", "watched_title")
-            watching = query.getTitles(userid, "watching", "watching_title")
-            watchlist = query.getTitles(userid, "watchlist", "watchlist_title")
-            
-            tvmovies = query.get_all(schema.TVMovie)
-            return render_template('my_profile.html', userid=userid, tvmovies=tvmovies, username=username, watched=watched, watching=watching, watchlist=watchlist)
+            lists = query.getUserLists(userid)
+
+            return render_template('my_profile.html', userid=userid, username=username, watched=lists["watched"], watching=lists["watching"], watchlist=lists["watchlist"])
         except Exception as e:
-            logger.warning(f"Error loading profile page: {e}")
+            logger.warning("Error loading profile page: %s", e)
 
     @app.route('/about')
     def about():
@@ -228,19 +262,41 @@ def create_app():
                         logger.warning("Comment length too long")
                     else:
                         query.addComment(user.UserID, postid, content)
-                        logger.info(f"Comment created on Post: {postid}")
+                        logger.info("Comment created on Post: %s", postid)
                 
                 deletepostid = request.form.get('deletepostid')
                 if deletepostid:
                     query.deletePost(deletepostid)
-                    logger.info(f"Post has been Deleted: {deletepostid}")
+                    logger.info("Post has been Deleted: %s", deletepostid)
                 return redirect(url_for('my_feed'))
             userid = user.UserID
-            posts = query.getFeed(userid)
-            return render_template('feed.html', userid=userid, posts=posts, getPostComments=query.getPostComments )
+            posts = query.getFeed(userid, before_date=request.args.get('before_date'),
+                                  before_postid=request.args.get('before_postid', type=int))
+            post_comments = query.getCommentsForPosts([post["postid"] for post in posts])
+            next_cursor = query.getFeedCursor(posts)
+            return render_template('feed.html', userid=userid, posts=posts, post_comments=post_comments, next_cursor=next_cursor)
         except Exception as e:
-            logger.warning(f"Error Getting Feed Page: {e}")
+            logger.warning("Error Getting Feed Page: %s", e)
             return render_template('feed.html', userid=userid, posts=[])
+
+    @app.route('/my_feed/more')
+    def load_more_feed():
+        """Load more: returns the next page of the feed after the given cursor as JSON"""
+        user = checkUserLogin()
+        if not user:
+            logger.warning("No user logged in")
+            return jsonify({'success': False, 'message': 'Not logged in'}), 401
+
+        before_date = request.args.get('before_date')
+        before_postid = request.args.get('before_postid', type=int)
+        if not before_date or before_postid is None:
+            return jsonify({'success': False, 'message': 'before_date and before_postid are required'}), 400
+
+        posts = query.getFeed(user.UserID, before_date=before_date, before_postid=before_postid)
+        post_comments = query.getCommentsForPosts([post["postid"] for post in posts])
+        for post in posts:
+            post["comments"] = post_comments.get(post["postid"], [])
+        return jsonify({'success': True, 'posts': posts, 'next_cursor': query.getFeedCursor(posts)})
     
     @app.route('/create_post', methods=['GET', 'POST'])
     def create_post():
@@ -265,11 +321,10 @@ def create_app():
                 logger.info("User has succesfully created a post")
                 return redirect(url_for('my_feed'))
             except Exception as e:
-                logger.warning(f"Error Occurred while creating post {e}")
+                logger.warning("Error Occurred while creating post %s", e)
                 return redirect('/create_post')
 
-        tvmovies = query.get_all(schema.TVMovie)
-        return render_template('createpost.html', userid=userid, tvmovies=tvmovies)
+        return render_template('createpost.html', userid=userid)
     
     @app.route('/discover')
     def discover():
@@ -280,14 +335,23 @@ def create_app():
             logger.warning("No User is logged in")
             return redirect(url_for('login'))
         
-        suggested_users = query.get_all_users_except_current(user.UserID)
-        following = query.get_following(user.UserID)
-        followers = query.get_followers(user.UserID)
-        
-        return render_template('discover.html', userid=user.UserID, 
+        # the three lists don't depend on each other, so load them concurrently
+        try:
+            suggested_users, following, followers = async_query.run_all(
+                async_query.get_all_users_except_current(user.UserID),
+                async_query.get_following(user.UserID),
+                async_query.get_followers(user.UserID))
+        except Exception as e:
+            logger.warning("Error loading discover page: %s", e)
+            suggested_users, following, followers = [], [], []
+        # follow state for the followers list, taken from the list we already have
+        following_ids = {u["UserID"] for u in following}
+
+        return render_template('discover.html', userid=user.UserID,
                              suggested_users=suggested_users,
                              following=following,
-                             followers=followers)
+                             followers=followers,
+                             following_ids=following_ids)
 
     @app.route('/follow/<int:user_id>', methods=['POST'])
     def follow_user_route(user_id):
@@ -338,7 +402,7 @@ def create_app():
             query.addToWatchTable(user.UserID, mediaid, "watched")
             logger.info("User has successfully added media to watched")
         except Exception as e:
-            logger.warning(f"Error adding to watched: {e}")
+            logger.warning("Error adding to watched: %s", e)
 
     
         return redirect(url_for('my_profile'))
@@ -351,15 +415,15 @@ def create_app():
             logger.warning("No user is logged in")
             return redirect(url_for('login'))
 
-        title = request.form.get("title")
-        if not title:
+        mediaid = request.form.get("mediaid")
+        if not mediaid:
             return redirect(url_for('my_profile'))
 
         try:
-            query.removeFromWatchTable(user.UserID, title, "watched")
+            query.removeFromWatchTable(user.UserID, mediaid, "watched")
             logger.info("User has successfully removed media from watched")
         except Exception as e:
-            logger.warning(f"Error removing from watched: {e}")
+            logger.warning("Error removing from watched: %s", e)
 
         return redirect(url_for('my_profile'))
 
@@ -380,7 +444,7 @@ def create_app():
             query.addToWatchTable(user.UserID, mediaid, "watching")
             logger.info("User has successfully added media to watching")
         except Exception as e:
-            logger.warning(f"Error adding to currently watching: {e}")
+            logger.warning("Error adding to currently watching: %s", e)
 
         return redirect(url_for('my_profile'))
     
@@ -392,15 +456,15 @@ def create_app():
             logger.warning("No User is logged in")
             return redirect(url_for('login'))
 
-        title = request.form.get("title")
-        if not title:
+        mediaid = request.form.get("mediaid")
+        if not mediaid:
             return redirect(url_for('my_profile'))
 
         try:
-            query.removeFromWatchTable(user.UserID, title, "watching")
+            query.removeFromWatchTable(user.UserID, mediaid, "watching")
             logger.info("User has successfully removed media from watching")
         except Exception as e:
-            logger.warning(f"Error removing from currently watching: {e}")
+            logger.warning("Error removing from currently watching: %s", e)
 
         return redirect(url_for('my_profile'))
     
@@ -420,7 +484,7 @@ def create_app():
             query.addToWatchTable(user.UserID, mediaid, "watchlist")
             logger.info("User has successfully added media to watchlist")
         except Exception as e:
-            logger.warning(f"Error adding to watchlist: {e}")
+            logger.warning("Error adding to watchlist: %s", e)
 
         return redirect(url_for('my_profile'))
     
@@ -432,40 +496,28 @@ def create_app():
             logger.warning("No user is logged in")
             return redirect(url_for('login'))
 
-        title = request.form.get("title")
-        if not title:
+        mediaid = request.form.get("mediaid")
+        if not mediaid:
             return redirect(url_for('my_profile'))
 
         try:
-            query.removeFromWatchTable(user.UserID, title, "watchlist")
+            query.removeFromWatchTable(user.UserID, mediaid, "watchlist")
             logger.info("User successfully removed media from watchlist")
         except Exception as e:
-            logger.warning(f"Error removing from watchlist: {e}")
+            logger.warning("Error removing from watchlist: %s", e)
 
         return redirect(url_for('my_profile'))
     
     def checkUserLogin():
         """Check if the User is logged in"""
-        loggedinuser = request.cookies.get('userloggedin')
-        return userCache.get(loggedinuser)
+        return sessions.get(request.cookies.get('userloggedin'))
     
     # Error handling
-    def _tail_log(path, max_lines=80):
-        try:
-            with open(path, 'rb') as f:
-                data = f.read()
-            text = data.decode('utf-8', errors='replace')
-            lines = text.splitlines()
-            tail_lines = lines[-max_lines:]
-            return "\n".join(tail_lines)
-        except Exception:
-            return None
-
     LOG_PATH = os.path.join(os.getcwd(), 'logs', 'log.txt')
 
     @app.errorhandler(404)
     def not_found_error(error):
-        details = _tail_log(LOG_PATH, max_lines=40)
+        details = tail_log(LOG_PATH, max_lines=40)
         return render_template('error.html', title='Page Not Found', message='The requested page was not found.', code=404, details=details), 404
 
     @app.errorhandler(500)
@@ -475,7 +527,7 @@ def create_app():
             exc_str = str(error)
         except Exception:
             exc_str = None
-        log_tail = _tail_log(LOG_PATH, max_lines=120)
+        log_tail = tail_log(LOG_PATH, max_lines=120)
         details_parts = []
         if exc_str:
             details_parts.append(f"Exception: {exc_str}")
@@ -497,26 +549,34 @@ def create_app():
             return redirect(url_for('login'))
     
         search_results = []
-        search_term = ""
-    
-        if request.method == 'POST':
-            search_term = request.form.get('search_term', '').strip()
-            if search_term:
-                try:
-                    #use the new search function
-                    search_results = query.search_users(search_term, user.UserID)
-                    logger.info(f"User searched for: {search_term}, found {len(search_results)} results")
-                except Exception as e:
-                    logger.error(f"Search error: {e}")
-                    search_results = []
+        has_next = False
+        # searches are POSTed from the form; the page links repeat them with GET
+        search_term = request.values.get('search_term', '').strip()
+        page = max(request.args.get('page', 1, type=int), 1)
     
-        return render_template('search_users.html', 
-                     search_results=search_results, 
+        if search_term:
+            try:
+                # fetch one extra row to know whether there is a next page
+                search_results = query.search_users(search_term, user.UserID,
+                                                    limit=SEARCH_PAGE_SIZE + 1,
+                                                    offset=(page - 1) * SEARCH_PAGE_SIZE)
+                has_next = len(search_results) > SEARCH_PAGE_SIZE
+                search_results = search_results[:SEARCH_PAGE_SIZE]
+                logger.info("User searched for: %s, found %s results", search_term, len(search_results))
+            except Exception as e:
+                logger.error("Search error: %s", e)
+                search_results = []
+
+        # one query for the follow state of the whole page of results
+        following_ids = query.get_following_ids(user.UserID, [u["UserID"] for u in search_results])
+
+        return render_template('search_users.html',
+                     search_results=search_results,
                      search_term=search_term,
-                     logged_in_user=user,  
-                     get_followers=query.get_followers,
-                     get_following=query.get_following,
-                     is_following=query.is_following)
+                     page=page,
+                     has_next=has_next,
+                     logged_in_user=user,
+                     following_ids=following_ids)
     
     @app.route('/delete_comment/<int:comment_id>', methods=['POST'])
     def delete_comment(comment_id):
@@ -529,11 +589,11 @@ def create_app():
         try:
             success = query.deleteComment(comment_id, user.UserID)
             if success:
-                logger.info(f"Comment {comment_id} deleted successfully by user {user.UserID}")
+                logger.info("Comment %s deleted successfully by user %s", comment_id, user.UserID)
             else:
-                logger.warning(f"User {user.UserID} failed to delete comment {comment_id}")
+                logger.warning("User %s failed to delete comment %s", user.UserID, comment_id)
         except Exception as e:
-            logger.error(f"Error deleting comment {comment_id}: {e}")
+            logger.error("Error deleting comment %s: %s", comment_id, e)
 
         return redirect(request.referrer or url_for('my_feed'))
     
@@ -546,19 +606,35 @@ def create_app():
             logger.warning("No User logged in")
             return redirect(url_for('login'))
         
+        if user_id == user.UserID:
+            # cached fragments link every author here, the viewer included
+            return redirect(url_for('my_profile'))
+
         try:
             otheruserid = user_id
-            otheruser = query.get_User(schema.User, UserID=otheruserid)
-            username = otheruser.UName
-            watched = query.getTitles(otheruserid, "watched", "watched_title")
-            watching = query.getTitles(otheruserid, "watching", "watching_title")
-            watchlist = query.getTitles(otheruserid, "watchlist", "watchlist_title")
-            following = query.checkFollowing(user.UserID,otheruserid)
-            tvmovies = query.get_all(schema.TVMovie)
-            return render_template('other_user_profile.html', userid=user.UserID, following=following, otheruserid=otheruserid, tvmovies=tvmovies, username=username, watched=watched, watching=watching, watchlist=watchlist)
+            following = False
+            otheruser, lists, following = async_query.run_all(
+                async_query.getUser(otheruserid),
+                async_query.getUserLists(otheruserid),
+                async_query.checkFollowing(user.UserID, otheruserid))
+            username = otheruser["UName"]
+            return render_template('other_user_profile.html', userid=user.UserID, following=following, otheruserid=otheruserid, username=username, watched=lists["watched"], watching=lists["watching"], watchlist=lists["watchlist"])
         except Exception as e:
-            logger.warning(f"Error loading profile page: {e}")
-            return render_template('other_user_profile.html', userid=user.UserID, following=following, otheruserid=otheruserid, tvmovies=[], username="Unknown", watched=[], watching=[], watchlist=[])
+            logger.warning("Error loading profile page: %s", e)
+            return render_template('other_user_profile.html', userid=user.UserID, following=following, otheruserid=otheruserid, username="Unknown", watched=[], watching=[], watchlist=[])
+
+    @app.route('/media/search')
+    def media_search():
+        """Typeahead: returns the TV shows/movies whose title starts with q as JSON"""
+        user = checkUserLogin()
+        if not user:
+            logger.warning("No user logged in")
+            return jsonify({'success': False, 'message': 'Not logged in'}), 401
+
+        prefix = request.args.get('q', '')
+        limit = min(request.args.get('limit', 10, type=int), 50)
+        results = catalog.search(prefix, limit)
+        return jsonify([{'MediaID': m['MediaID'], 'Title': m['Title'], 'Year': m['Year'], 'Type': m['Type']} for m in results])
 
     @app.route('/media/<int:media_id>',  methods=['GET', 'POST'])
     def media_page(media_id):
@@ -569,50 +645,122 @@ def create_app():
             logger.warning("No User logged in")
             return redirect(url_for('login'))
         try:
-            media = query.getMediaInfo(media_id)
-            posts = query.getMediaPosts(media_id)
-            if posts:
-                averagerating = int(sum(post["rating"] for post in posts)/ len(posts) )
-            else:
-                averagerating = 0
-
             if request.method == 'POST':
                 postid = request.form.get('postid')
                 content = request.form.get('content')
                 if postid and content:
                     query.addComment(user.UserID, postid, content)
-                    logger.info(f"Comment created on Post: {postid}")
+                    logger.info("Comment created on Post: %s", postid)
 
                 deletepostid = request.form.get('deletepostid')
                 if deletepostid:
                     query.deletePost(deletepostid)
-                    logger.info(f"Post has been Deleted: {deletepostid}")
+                    logger.info("Post has been Deleted: %s", deletepostid)
                 return redirect(url_for('media_page', media_id = media_id))
 
-            return render_template('media_page.html', userid=user.UserID, averagerating=averagerating, media=media, posts=posts, getPostComments=query.getPostComments)
+            # the header and post cards are the same for every viewer: render them once per version
+            version = query.getMediaVersion(media_id)
+            key = ("media_page", media_id, *version) if version else None
+            page = fragments.get(key) if key else None
+            if page is None:
+                try:
+                    media, posts, stats = async_query.run_all(
+                        async_query.getMediaInfo(media_id, raise_errors=True),
+                        async_query.getMediaPosts(media_id, raise_errors=True),
+                        async_query.getMediaStats(media_id, raise_errors=True))
+                    post_comments = query.getCommentsForPosts([post["postid"] for post in posts], raise_errors=True)
+                except Exception as e:
+                    # show what there is, but don't keep a page missing its posts for every viewer
+                    logger.warning("Error loading media page data, not caching it: %s", e)
+                    media, posts, stats, post_comments = None, [], None, {}
+                    key = None
+                if stats and stats["avg_rating"] is not None:
+                    averagerating = int(stats["avg_rating"])
+                else:
+                    averagerating = 0
+                page = (media["media_title"] if media else "",
+                        render_template('media_page_header.html', media=media, averagerating=averagerating),
+                        split_owner_blocks(render_template('media_page_posts.html', posts=posts, post_comments=post_comments)
+                                           if posts else ""))
+                if key:
+                    fragments.set(key, page)
+            title, header, posts = page
+            return render_template('media_page.html', userid=user.UserID, title=title, header=Markup(header), posts=personalize(posts, user.UserID))
         except Exception as e:
-            logger.warning(f"Error loading media page: {e}")
+            logger.warning("Error loading media page: %s", e)
             return render_template('media_page.html)')
     
+    @app.route('/top_media')
+    def top_media():
+        """Top Media page: lists the top rated or most reviewed TV shows/movies"""
+        logger.info("User has accessed top media page")
+        user = checkUserLogin()
+        sort = request.args.get('sort', 'rated')
+        if sort not in ('rated', 'reviewed'):
+            sort = 'rated'
+        media = query.getTopMedia(sort)
+        return render_template('top_media.html', userid=user.UserID if user else None, sort=sort, media=media)
+
+    @app.route('/pool_status')
+    def pool_status():
+        """Database connection pool usage and checkout wait times for this worker, as JSON"""
+        if not metrics_allowed():
+            return jsonify({'success': False, 'message': 'Forbidden'}), 403
+        status = db_pool_status(engine, db_max_overflow)
+        status["async_pool"] = async_query.pool_status()
+        return jsonify(status)
+
     @app.route('/logout', methods=['GET','POST'])
     def logout():
         """Allows a user to logout"""
         logger.info("User has logged out")
         
         try:
-            loggedinuser = request.cookies.get('userloggedin')
-
-            if loggedinuser in userCache:
-                del userCache[loggedinuser]
+            sessions.delete(request.cookies.get('userloggedin'))
         
             response = redirect(url_for('index'))
             response.delete_cookie('userloggedin')
 
             return response 
         except Exception as e:
-            logger.warning(f"Error logging user out: {e}")
+            logger.warning("Error logging user out: %s", e)
             return redirect(url_for('index'))
-        
+
+    @app.route('/delete_account', methods=['GET', 'POST'])
+    def delete_account():
+        """Delete the logged in user's account and everything they created, once they confirm their password"""
+        user = checkUserLogin()
+        if not user:
+            return redirect(url_for('login'))
+        if request.method == 'GET':
+            return render_template('delete_account.html', username=user.UName)
+
+        try:
+            account = query.get_User(schema.User, UserID=user.UserID)
+            matches = account is not None and check_password(request.form.get('PWord', ''), account.PWord)[0]
+        except PasswordHasherBusy:
+            logger.warning("Account deletion turned away, password hashing queue is full")
+            return render_template('delete_account.html', username=user.UName,
+                                   error="The site is busy right now, please try again in a moment."), 503
+        if not matches:
+            logger.warning("Account deletion attempted with incorrect password for user %s", user.UserID)
+            return render_template('delete_account.html', username=user.UName, error="Incorrect password")
+
+        # the purge commits batch by batch on connections of its own; end this request's
+        # transaction first so it holds no locks on the rows being deleted
+        close_request_session()
+        counts = query.purgeUser(user.UserID)
+        if counts is None:
+            return render_template('delete_account.html', username=user.UName,
+                                   error="Your account could not be deleted, please try again."), 500
+        logger.info("Deleted account of user %s: %s", user.UserID, counts)
+        # sessions kept outside the database (session_backend=memory)
+        sessions.delete_user(user.UserID)
+
+        response = redirect(url_for('index'))
+        response.delete_cookie('userloggedin')
+        return response
+
     return app
     
 if __name__ == "__main__":
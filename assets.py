@@ -0,0 +1,229 @@
+"""assets.py: build fingerprinted, precompressed static files and serve them with long-lived caching
+
+The build (python assets.py) copies everything in static/ to static/dist/ under a
+name carrying a hash of its content, e.g. loginStyle.css -> loginStyle.3f9c0a1b2d.css,
+and writes static/dist/manifest.json mapping one to the other. On top of that:
+    CSS, JavaScript and SVG get .gz and .br copies, compressed once at build time
+    the images in IMAGE_WIDTHS get AVIF, WebP and original-format copies resized to
+    the widths they are shown at (the navbar logo is 80px wide, not 1080px)
+
+Templates ask for files with asset_url('loginStyle.css') and
+picture('images/Logo.png', 'Logo Image', '80px', class_='MiniLogo'). A hashed name
+changes whenever its content does, so /static/dist/ answers with
+Cache-Control: immutable and a year's max-age, and repeat visits skip the request.
+Without a build (or for a file the manifest doesn't know) the helpers fall back to
+the plain /static/ URL.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import os
+import shutil
+from markupsafe import Markup, escape
+from flask import request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = 'manifest.json'
+
+# widths, in CSS pixels and at 2x, each image is displayed at
+IMAGE_WIDTHS = {
+    "images/Logo.png": (80, 160),
+    "images/show1.jpg": (300, 600),
+    "images/show2.jpg": (300, 600),
+    "images/show4.jpg": (300, 600),
+    "images/mainpage.jpg": (600, 1200),
+    "images/aboutright.jpg": (500,),
+    "images/review.gif": (500, 1000),
+}
+# modern formats, best first; browsers take the first <source> they support
+IMAGE_FORMATS = (("avif", "image/avif"), ("webp", "image/webp"))
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg')
+# precompressed files, best first: (Accept-Encoding token, file suffix)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# logical path -> hashed path, and images -> {format: [(width, hashed path), ...]}
+_manifest = {"files": {}, "images": {}}
+
+
+def fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def hashed_name(path: str, data: bytes, suffix: str = "") -> str:
+    """images/Logo.png -> images/Logo<suffix>.<hash>.png"""
+    root, extension = os.path.splitext(path)
+    return f"{root}{suffix}.{fingerprint(data)}{extension}"
+
+
+def _write(output_dir: str, name: str, data: bytes) -> None:
+    path = os.path.join(output_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _compress(output_dir: str, name: str, data: bytes) -> None:
+    """Write .gz and .br copies next to a file, when they come out smaller"""
+    import brotli
+    # mtime=0 so the same input always gives the same .gz
+    compressed = {".gz": gzip.compress(data, compresslevel=9, mtime=0),
+                  ".br": brotli.compress(data, quality=11)}
+    for suffix, body in compressed.items():
+        if len(body) < len(data):
+            _write(output_dir, name + suffix, body)
+
+
+def _resize(path: str, widths: tuple) -> dict:
+    """{format: [(width, bytes), ...]} for every modern format and the original one"""
+    from PIL import Image
+    with Image.open(os.path.join(STATIC_DIR, path)) as original:
+        original.load()
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    fallback = {"jpg": "JPEG", "jpeg": "JPEG", "png": "PNG", "gif": "GIF"}[extension]
+    variants = {name: [] for name, _ in IMAGE_FORMATS}
+    variants[extension] = []
+    # never upscale: widths past the original collapse into the original size
+    for width in sorted({min(width, original.width) for width in widths}):
+        image = original if width == original.width else original.resize(
+            (width, round(original.height * width / original.width)), Image.LANCZOS)
+        if fallback == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        for name, _ in IMAGE_FORMATS:
+            buffer = io.BytesIO()
+            image.save(buffer, name.upper(), quality=60 if name == "avif" else 80)
+            variants[name].append((width, buffer.getvalue()))
+        buffer = io.BytesIO()
+        image.save(buffer, fallback, **({"quality": 85, "optimize": True} if fallback == "JPEG" else {"optimize": True}))
+        variants[extension].append((width, buffer.getvalue()))
+    return variants
+
+
+def build_assets(static_dir: str = STATIC_DIR, output_dir: str = DIST_DIR) -> dict:
+    """Build output_dir from static_dir and return the manifest"""
+    # start from scratch, but only ever delete a previous build
+    if os.path.isfile(os.path.join(output_dir, MANIFEST)):
+        shutil.rmtree(output_dir)
+    elif os.path.isdir(output_dir) and os.listdir(output_dir):
+        raise ValueError(f"{output_dir} is not empty and holds no {MANIFEST}; refusing to overwrite it")
+    manifest = {"files": {}, "images": {}}
+    for directory, subdirectories, files in os.walk(static_dir):
+        # never fingerprint the build itself
+        subdirectories[:] = [d for d in subdirectories
+                             if os.path.abspath(os.path.join(directory, d)) != os.path.abspath(output_dir)]
+        for filename in sorted(files):
+            path = os.path.relpath(os.path.join(directory, filename), static_dir).replace(os.sep, '/')
+            with open(os.path.join(static_dir, path), 'rb') as f:
+                data = f.read()
+            name = hashed_name(path, data)
+            _write(output_dir, name, data)
+            manifest["files"][path] = name
+            if path.endswith(COMPRESSED_EXTENSIONS):
+                _compress(output_dir, name, data)
+
+    for path, widths in IMAGE_WIDTHS.items():
+        if path not in manifest["files"]:
+            logger.warning("Image %s is listed in IMAGE_WIDTHS but missing from %s", path, static_dir)
+            continue
+        manifest["images"][path] = {}
+        for image_format, sizes in _resize(path, widths).items():
+            entries = []
+            for width, data in sizes:
+                name = hashed_name(os.path.splitext(path)[0] + f".{image_format}", data, suffix=f"-{width}")
+                _write(output_dir, name, data)
+                entries.append((width, name))
+            manifest["images"][path][image_format] = entries
+
+    _write(output_dir, MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest(output_dir: str = DIST_DIR) -> dict:
+    """Read the manifest of the last build; an empty one if there was no build"""
+    global _manifest
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            _manifest = json.load(f)
+    except FileNotFoundError:
+        logger.info("No %s in %s: run python assets.py to serve fingerprinted static files", MANIFEST, output_dir)
+        _manifest = {"files": {}, "images": {}}
+    return _manifest
+
+
+def asset_url(path: str) -> str:
+    """URL of a file in static/: its fingerprinted copy if it was built, else the plain one"""
+    name = _manifest["files"].get(path)
+    if name is None:
+        return url_for('static', filename=path)
+    return url_for('dist_asset', filename=name)
+
+
+def _srcset(entries: list) -> str:
+    return ", ".join(f"{url_for('dist_asset', filename=name)} {width}w" for width, name in entries)
+
+
+def picture(path: str, alt: str, sizes: str, class_: str = None) -> Markup:
+    """<picture> offering the resized AVIF, WebP and original-format copies of an image
+
+        sizes is the <img sizes> attribute: how wide the image is shown, e.g. "80px"
+    """
+    attributes = f' alt="{escape(alt)}"' + (f' class="{escape(class_)}"' if class_ else "")
+    variants = _manifest["images"].get(path)
+    if not variants:
+        return Markup(f'<img src="{asset_url(path)}"{attributes}>')
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    fallback = variants[extension]
+    sources = "".join(f'<source type="{mimetype}" srcset="{_srcset(variants[name])}" sizes="{escape(sizes)}">'
+                      for name, mimetype in IMAGE_FORMATS if variants.get(name))
+    return Markup(f'<picture>{sources}<img src="{url_for("dist_asset", filename=fallback[-1][1])}" '
+                  f'srcset="{_srcset(fallback)}" sizes="{escape(sizes)}"{attributes}></picture>')
+
+
+def init_assets(app) -> None:
+    """Load the asset manifest, add asset_url/picture to templates and serve /static/dist/"""
+    load_manifest()
+    app.jinja_env.globals.update(asset_url=asset_url, picture=picture)
+
+    @app.route('/static/dist/<path:filename>')
+    def dist_asset(filename):
+        """A fingerprinted static file, precompressed when the client accepts it, cached for good"""
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = None
+        for encoding, suffix in ENCODINGS:
+            path = safe_join(DIST_DIR, filename + suffix)
+            if encoding in request.accept_encodings and path and os.path.isfile(path):
+                response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+                response.content_encoding = encoding
+                break
+        if response is None:
+            response = send_from_directory(DIST_DIR, filename, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build fingerprinted, resized and precompressed static files")
+    parser.add_argument("--output", default=DIST_DIR, help="directory to build into")
+    args = parser.parse_args()
+
+    manifest = build_assets(output_dir=args.output)
+    print(f"Built {len(manifest['files'])} files and {len(manifest['images'])} resized images into {args.output}")
+    for path, variants in sorted(manifest["images"].items()):
+        # the smallest copy of each format
+        sizes = ", ".join(f"{name} {os.path.getsize(os.path.join(args.output, entries[0][1]))} B"
+                          for name, entries in variants.items())
+        print(f"  {path:<24}{os.path.getsize(os.path.join(STATIC_DIR, path)):>9} B -> {sizes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""bench_async.py: sequential vs concurrent page queries
+
+Seeds a scratch schema (the same data as bench_indexes, with migration 001's keys
+and indexes applied), then times the independent queries behind two pages:
+    discover: suggested users, following, followers
+    profile:  another user's name, watch lists and follow state
+once one after another on a single connection, the way a request session runs
+them, and once started together through db/async_query.run_all. The scratch
+schema is dropped afterwards; the app's own tables are never touched.
+
+usage:
+    python -m benchmarks.bench_async --users 20000 --runs 100
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from sqlalchemy import create_engine, text
+import db.query as query
+import db.async_query as async_query
+from db.server import db_url, engine
+from db.migrate import run_sql_file
+from benchmarks.bench_indexes import seed
+
+SCHEMA = "bench_async"
+MIGRATION = os.path.join(os.path.dirname(__file__), '..', 'db', 'migrations', '001_association_keys.sql')
+
+# (sql, params) per page; every statement of a page is independent of the others
+PAGES = {
+    "discover": lambda me, other: [
+        (query.SUGGESTED_USERS_QUERY, {"user_id": me}),
+        (query.FOLLOWING_QUERY, {"user_id": me}),
+        (query.FOLLOWERS_QUERY, {"user_id": me}),
+    ],
+    "profile": lambda me, other: [
+        (async_query.USER_QUERY, {"user_id": other}),
+        (query.USER_LISTS_QUERY, {"user_id": other}),
+        (query.CHECK_FOLLOWING_QUERY, {"userid": me, "otheruserid": other}),
+    ],
+}
+
+ASYNC_PAGES = {
+    "discover": lambda me, other: [
+        async_query.get_all_users_except_current(me),
+        async_query.get_following(me),
+        async_query.get_followers(me),
+    ],
+    "profile": lambda me, other: [
+        async_query.getUser(other),
+        async_query.getUserLists(other),
+        async_query.checkFollowing(me, other),
+    ],
+}
+
+
+def time_sequential(bench_engine, page: str, users: int, runs: int) -> float:
+    """Median milliseconds to run a page's queries one after another"""
+    timings = []
+    with bench_engine.connect() as connection:
+        for _ in range(runs):
+            me, other = random.randint(1, users), random.randint(1, users)
+            start = time.perf_counter()
+            for statement, params in PAGES[page](me, other):
+                [dict(row) for row in connection.execute(statement, params).mappings()]
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def time_concurrent(page: str, users: int, runs: int) -> float:
+    """Median milliseconds to run a page's queries concurrently"""
+    timings = []
+    for _ in range(runs):
+        me, other = random.randint(1, users), random.randint(1, users)
+        start = time.perf_counter()
+        async_query.run_all(*ASYNC_PAGES[page](me, other))
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sequential vs concurrent page queries")
+    parser.add_argument("--users", type=int, default=20000, help="number of seeded users")
+    parser.add_argument("--runs", type=int, default=100, help="page loads per measurement")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the query parameters")
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        print(f"Seeding {args.users} users into schema {SCHEMA}...")
+        seed(connection, args.users, SCHEMA)
+        run_sql_file(connection, MIGRATION)
+        connection.execute(text("ANALYZE"))
+        connection.commit()
+
+    bench_engine = create_engine(db_url, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    async_query.init_pool(server_settings={"search_path": SCHEMA})
+    results = {}
+    try:
+        for page in PAGES:
+            # warm both pools so connection setup isn't timed
+            time_sequential(bench_engine, page, args.users, 3)
+            time_concurrent(page, args.users, 3)
+            random.seed(args.seed)
+            sequential = time_sequential(bench_engine, page, args.users, args.runs)
+            random.seed(args.seed)
+            concurrent = time_concurrent(page, args.users, args.runs)
+            results[page] = (sequential, concurrent)
+    finally:
+        bench_engine.dispose()
+        with engine.connect() as connection:
+            connection.execute(text(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE'))
+            connection.commit()
+
+    print(f"\n{'page':<12}{'sequential (ms)':>18}{'concurrent (ms)':>18}{'speedup':>10}")
+    for page, (sequential, concurrent) in results.items():
+        print(f"{page:<12}{sequential:>18.3f}{concurrent:>18.3f}{sequential / concurrent:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
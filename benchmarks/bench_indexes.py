@@ -0,0 +1,135 @@
+"""bench_indexes.py: before/after benchmark for db/migrations/001_association_keys.sql
+
+Copies the bare tables (columns only, no keys or indexes) into a scratch schema,
+seeds them with generate_series, times the lookups the app runs on every request,
+applies the migration to the scratch schema and times them again. The scratch
+schema is dropped afterwards; the app's own tables are never touched.
+
+usage:
+    python -m benchmarks.bench_indexes --users 50000 --runs 50
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from sqlalchemy import text
+from db.server import engine
+from db.migrate import run_sql_file
+
+SCHEMA = "bench_indexes"
+MIGRATION = os.path.join(os.path.dirname(__file__), '..', 'db', 'migrations', '001_association_keys.sql')
+TABLES = ["user", "tvmovie", "post", "comment", "follows", "creates", "makes", "watched", "watching", "watchlist"]
+
+# the lookups behind login, follow checks, the feed join and the watch list removal
+QUERIES = {
+    "login (get_User by Email)": ('SELECT * FROM "user" WHERE "Email" = :email LIMIT 1',
+                                  lambda n: {"email": f"user{random.randint(1, n)}@example.com"}),
+    "is_following": ('SELECT 1 FROM "follows" WHERE "UserID" = :a AND "FollowerID" = :b',
+                     lambda n: {"a": random.randint(1, n), "b": random.randint(1, n)}),
+    "get_followers": ('SELECT U."UserID" FROM "follows" F JOIN "user" U ON F."UserID" = U."UserID" WHERE F."FollowerID" = :a',
+                      lambda n: {"a": random.randint(1, n)}),
+    "feed join": ('SELECT P."PostID" FROM "follows" F JOIN "creates" C ON F."FollowerID" = C."UserID" '
+                  'JOIN "post" P ON C."PostID" = P."PostID" WHERE F."UserID" = :a',
+                  lambda n: {"a": random.randint(1, n)}),
+    "post comments": ('SELECT C."CommentID" FROM "comment" C JOIN "makes" M ON C."CommentID" = M."CommentID" WHERE C."PostID" = :p',
+                      lambda n: {"p": random.randint(1, n)}),
+    "title lookup": ('SELECT "MediaID" FROM "tvmovie" WHERE "Title" = :title',
+                     lambda n: {"title": f"Title {random.randint(1, max(n // 10, 1))}"}),
+}
+
+
+def seed(connection, users: int, schema: str = SCHEMA) -> None:
+    """Create bare copies of the app tables in the scratch schema and fill them"""
+    connection.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+    connection.execute(text(f'CREATE SCHEMA "{schema}"'))
+    connection.execute(text(f'SET search_path TO "{schema}"'))
+    for table in TABLES:
+        connection.execute(text(f'CREATE TABLE "{table}" (LIKE public."{table}")'))
+
+    titles = max(users // 10, 1)
+    connection.execute(text(
+        """
+        INSERT INTO "user" ("UserID", "FName", "LName", "UName", "PWord", "Email")
+        SELECT g, 'First', 'Last', 'user' || g, 'x', 'user' || g || '@example.com' FROM generate_series(1, :n) g
+        """), {"n": users})
+    connection.execute(text(
+        """
+        INSERT INTO "tvmovie" ("MediaID", "Title", "Genre", "Year", "Type")
+        SELECT g, 'Title ' || g, 'Drama', '2020', 'TV' FROM generate_series(1, :n) g
+        """), {"n": titles})
+    # every user follows 20 random users and has written one post with two comments
+    connection.execute(text(
+        """
+        INSERT INTO "follows" ("UserID", "FollowerID")
+        SELECT u, 1 + floor(random() * :n)::int FROM generate_series(1, :n) u, generate_series(1, 20)
+        """), {"n": users})
+    connection.execute(text(
+        """
+        INSERT INTO "post" ("PostID", "MediaID", "Title", "Date", "Content", "Spoiler", "Rating")
+        SELECT g, 1 + g % :t, 'Post', '2025-01-01', 'Content', false, 1 + g % 4 FROM generate_series(1, :n) g
+        """), {"n": users, "t": titles})
+    connection.execute(text('INSERT INTO "creates" ("UserID", "PostID") SELECT g, g FROM generate_series(1, :n) g'), {"n": users})
+    connection.execute(text(
+        """
+        INSERT INTO "comment" ("CommentID", "PostID", "Date", "Content")
+        SELECT g, 1 + g % :n, '2025-01-01', 'Comment' FROM generate_series(1, :n * 2) g
+        """), {"n": users})
+    connection.execute(text('INSERT INTO "makes" ("UserID", "CommentID") SELECT 1 + g % :n, g FROM generate_series(1, :n * 2) g'), {"n": users})
+    for table in ("watched", "watching", "watchlist"):
+        connection.execute(text(
+            f"""
+            INSERT INTO "{table}" ("UserID", "MediaID")
+            SELECT u, 1 + floor(random() * :t)::int FROM generate_series(1, :n) u, generate_series(1, 5)
+            """), {"n": users, "t": titles})
+    connection.execute(text("ANALYZE"))
+
+
+def time_queries(connection, users: int, runs: int) -> dict:
+    """Run every query `runs` times and return the median latency in milliseconds"""
+    results = {}
+    for name, (sql, make_params) in QUERIES.items():
+        statement = text(sql)
+        timings = []
+        for _ in range(runs):
+            params = make_params(users)
+            start = time.perf_counter()
+            connection.execute(statement, params).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = statistics.median(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the association key/index migration")
+    parser.add_argument("--users", type=int, default=50000, help="number of seeded users")
+    parser.add_argument("--runs", type=int, default=50, help="executions per query")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the query parameters")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with engine.connect() as connection:
+        try:
+            print(f"Seeding {args.users} users into schema {SCHEMA}...")
+            seed(connection, args.users)
+            connection.commit()
+
+            before = time_queries(connection, args.users, args.runs)
+
+            run_sql_file(connection, MIGRATION)
+            connection.execute(text("ANALYZE"))
+            connection.commit()
+
+            after = time_queries(connection, args.users, args.runs)
+        finally:
+            connection.rollback()
+            connection.execute(text(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE'))
+            connection.commit()
+
+    print(f"\n{'query':<28}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name in QUERIES:
+        print(f"{name:<28}{before[name]:>14.3f}{after[name]:>14.3f}{before[name] / after[name]:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
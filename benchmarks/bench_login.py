@@ -0,0 +1,91 @@
+"""bench_login.py: password check throughput, and what it does to other requests
+
+Starts --clients threads that each check a password over and over, like a burst of
+logins, while one more thread times a cheap database query, like every other
+route. Runs twice: bcrypt called inline on the caller's thread (how /login used
+to work) and through passwords.check_password's bounded pool. Reports logins per
+second, login latency, turned away logins, and the cheap query's latency.
+
+usage:
+    python -m benchmarks.bench_login --clients 32 --seconds 10
+"""
+import argparse
+import statistics
+import threading
+import time
+import bcrypt
+from sqlalchemy import text
+import passwords
+from db.server import engine
+
+PASSWORD = "correct horse battery staple"
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def run(check, clients: int, seconds: float) -> dict:
+    """Hammer check() from clients threads for seconds while timing SELECT 1"""
+    hashed = passwords.hash_password(PASSWORD)
+    stop = threading.Event()
+    logins, busy, probes = [], [0], []
+    lock = threading.Lock()
+
+    def client():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                check(hashed)
+            except passwords.PasswordHasherBusy:
+                with lock:
+                    busy[0] += 1
+                continue
+            with lock:
+                logins.append(time.perf_counter() - start)
+
+    def probe():
+        with engine.connect() as connection:
+            while not stop.is_set():
+                start = time.perf_counter()
+                connection.execute(text("SELECT 1")).scalar()
+                probes.append(time.perf_counter() - start)
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)] + [threading.Thread(target=probe)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "logins/s": len(logins) / seconds,
+        "login p50 (ms)": statistics.median(logins) * 1000 if logins else 0.0,
+        "login p95 (ms)": percentile(logins, 0.95) * 1000,
+        "turned away": busy[0],
+        "SELECT 1 p50 (ms)": statistics.median(probes) * 1000 if probes else 0.0,
+        "SELECT 1 p99 (ms)": percentile(probes, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark password checks under a login burst")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent logins")
+    parser.add_argument("--seconds", type=float, default=10, help="length of each run")
+    args = parser.parse_args()
+
+    print(f"bcrypt_rounds={passwords.bcrypt_rounds} password_workers={passwords.password_workers} "
+          f"password_queue_size={passwords.password_queue_size}")
+    inline = run(lambda hashed: bcrypt.checkpw(PASSWORD.encode('utf-8'), hashed.encode('utf-8')), args.clients, args.seconds)
+    pooled = run(lambda hashed: passwords.check_password(PASSWORD, hashed), args.clients, args.seconds)
+
+    print(f"\n{'':<20}{'inline':>12}{'pool':>12}")
+    for name in inline:
+        print(f"{name:<20}{inline[name]:>12.1f}{pooled[name]:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""bench_search.py: benchmark query.search_users against a large user table
+
+Seeds a scratch schema with a bare copy of the user table, then times the old
+search (three ILIKE '%term%' filters, no ranking) and the new ranked search before
+and after applying db/migrations/004_user_search.sql to the scratch schema. The
+scratch schema is dropped afterwards; the app's own tables are never touched.
+
+The trigram indexes need the pg_trgm extension. Without it migration 004 builds
+no indexes, so the last row only shows the cost of the ranking on a sequential
+scan (at 1M users the ranked search took 1346 ms against 1169 ms for the old one)
+and says nothing about the indexes; it is labelled as such.
+
+usage:
+    python -m benchmarks.bench_search --users 1000000 --runs 20
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from sqlalchemy import text
+from db.server import engine
+from db.migrate import run_sql_file
+
+SCHEMA = "bench_search"
+MIGRATION = os.path.join(os.path.dirname(__file__), '..', 'db', 'migrations', '004_user_search.sql')
+
+SYLLABLES = ["al", "an", "be", "ca", "da", "el", "fa", "jo", "ka", "li", "ma", "ni", "ol", "ra", "sa", "ti", "vi", "zo"]
+
+OLD_SEARCH = """
+    SELECT "UserID", "UName", "FName", "LName" FROM "user"
+    WHERE ("UName" ILIKE :contains OR "FName" ILIKE :contains OR "LName" ILIKE :contains)
+    AND "UserID" != 1
+    LIMIT 20
+"""
+
+NEW_SEARCH = """
+    SELECT "UserID", "UName", "FName", "LName" FROM "user"
+    WHERE (lower("UName") LIKE :contains OR lower("FName") LIKE :contains OR lower("LName") LIKE :contains)
+    AND "UserID" != 1
+    ORDER BY
+        CASE
+            WHEN lower("UName") = :term THEN 0
+            WHEN lower("FName") = :term OR lower("LName") = :term THEN 1
+            WHEN lower("UName") LIKE :prefix THEN 2
+            WHEN lower("FName") LIKE :prefix OR lower("LName") LIKE :prefix THEN 3
+            ELSE 4
+        END,
+        length("UName"), "UName"
+    LIMIT 20
+"""
+
+
+def seed(connection, users: int) -> None:
+    """Create a bare copy of the user table in the scratch schema and fill it with made up names"""
+    connection.execute(text(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE'))
+    connection.execute(text(f'CREATE SCHEMA "{SCHEMA}"'))
+    # public stays on the path so pg_trgm's operator classes resolve
+    connection.execute(text(f'SET search_path TO "{SCHEMA}", public'))
+    connection.execute(text('CREATE TABLE "user" (LIKE public."user")'))
+    connection.execute(text(
+        """
+        INSERT INTO "user" ("UserID", "FName", "LName", "UName", "PWord", "Email")
+        SELECT g,
+            initcap((:syllables)[1 + g % 18] || (:syllables)[1 + (g / 18) % 18]),
+            initcap((:syllables)[1 + (g / 7) % 18] || (:syllables)[1 + (g / 131) % 18] || 'son'),
+            (:syllables)[1 + (g / 3) % 18] || (:syllables)[1 + (g / 53) % 18] || g,
+            'x', 'user' || g || '@example.com'
+        FROM generate_series(1, :n) g
+        """), {"n": users, "syllables": SYLLABLES})
+    connection.execute(text('ALTER TABLE "user" ADD PRIMARY KEY ("UserID")'))
+    connection.execute(text('ANALYZE "user"'))
+
+
+def make_params(users: int) -> dict:
+    """A search term like the ones people type: a name fragment or a whole user name"""
+    kind = random.random()
+    if kind < 0.4:
+        term = random.choice(SYLLABLES) + random.choice(SYLLABLES)
+    elif kind < 0.8:
+        term = random.choice(SYLLABLES) + random.choice(SYLLABLES) + str(random.randint(1, users))
+    else:
+        term = random.choice(SYLLABLES) + random.choice(SYLLABLES) + "son"
+    return {"term": term, "prefix": term + "%", "contains": "%" + term + "%"}
+
+
+def time_query(connection, sql: str, users: int, runs: int) -> float:
+    """Median latency in milliseconds over runs random search terms"""
+    statement = text(sql)
+    timings = []
+    for _ in range(runs):
+        params = make_params(users)
+        start = time.perf_counter()
+        connection.execute(statement, params).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark user search")
+    parser.add_argument("--users", type=int, default=1000000, help="number of seeded users")
+    parser.add_argument("--runs", type=int, default=20, help="searches per measurement")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the search terms")
+    args = parser.parse_args()
+
+    results = {}
+    with engine.connect() as connection:
+        try:
+            print(f"Seeding {args.users} users into schema {SCHEMA}...")
+            seed(connection, args.users)
+            connection.commit()
+
+            random.seed(args.seed)
+            results["old search, no indexes"] = time_query(connection, OLD_SEARCH, args.users, args.runs)
+            random.seed(args.seed)
+            results["ranked search, no indexes"] = time_query(connection, NEW_SEARCH, args.users, args.runs)
+
+            run_sql_file(connection, MIGRATION)
+            connection.execute(text('ANALYZE "user"'))
+            connection.commit()
+            trigram = connection.execute(text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'")).scalar()
+
+            random.seed(args.seed)
+            label = "ranked search, trigram indexes" if trigram else "ranked search, 004 without pg_trgm"
+            results[label] = time_query(connection, NEW_SEARCH, args.users, args.runs)
+        finally:
+            connection.rollback()
+            connection.execute(text(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE'))
+            connection.commit()
+
+    print(f"\npg_trgm available: {'yes' if trigram else 'no'}")
+    print(f"{'query':<36}{'median (ms)':>14}")
+    for name, median in results.items():
+        print(f"{name:<36}{median:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
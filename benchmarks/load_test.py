@@ -0,0 +1,265 @@
+"""load_test.py: drive the logged-in pages concurrently and compare against a baseline
+
+Seeds the configured database with seed.py's synthetic users (load<n>@load.test, all
+with the password LOAD_PASSWORD), titles, follows, posts, comments and watch lists, then runs
+--concurrency workers for --duration seconds. Each worker logs in as a different
+synthetic user and keeps requesting a weighted mix of /my_feed, /my_profile,
+/media/<id>, /discover and /search_users. Reports p50/p95/p99 latency and requests
+per second for every route and overall.
+
+Seeding adds rows to whatever db_name points at, so give it a database of its own:
+
+    createdb tvshow_load
+    db_name=tvshow_load python -m benchmarks.load_test --seed 20000 --duration 0
+
+By default the app runs in this process behind Flask test clients (one per worker,
+so the numbers include the Python work but share one GIL). --url drives a running
+server over HTTP instead, e.g. gunicorn with several workers.
+
+--save-baseline writes the results to a JSON file; --compare reads one back and
+exits with status 1 when a route's p95 grew, or the overall requests per second
+fell, by more than --tolerance:
+
+    db_name=tvshow_load python -m benchmarks.load_test --duration 30 --save-baseline baseline.json
+    db_name=tvshow_load python -m benchmarks.load_test --duration 30 --compare baseline.json
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from sqlalchemy import text
+from db.server import engine
+from seed import seed_database
+
+LOAD_PASSWORD = "load-test-password"
+
+# route -> share of requests
+ROUTE_WEIGHTS = {
+    "my_feed": 35,
+    "media": 20,
+    "my_profile": 15,
+    "discover": 15,
+    "search_users": 15,
+}
+
+
+def load_ids() -> tuple:
+    """The synthetic users' emails and every MediaID"""
+    with engine.connect() as connection:
+        emails = connection.execute(text(
+            """SELECT "Email" FROM "user" WHERE "Email" LIKE 'load%@load.test' ORDER BY "UserID" """)).scalars().all()
+        media = connection.execute(text('SELECT "MediaID" FROM "tvmovie"')).scalars().all()
+    return emails, media
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def summarize(timings: list, errors: int, seconds: float) -> dict:
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "rps": round(len(timings) / seconds, 2),
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 2),
+    }
+
+
+class ClientDriver:
+    """Requests through a Flask test client of an app built in this process"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path: str) -> int:
+        return self.client.get(path).status_code
+
+    def post(self, path: str, data: dict) -> int:
+        return self.client.post(path, data=data).status_code
+
+
+class HttpDriver:
+    """Requests over HTTP to a running server"""
+
+    def __init__(self, url: str):
+        import requests
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+
+    def get(self, path: str) -> int:
+        return self.session.get(self.url + path, allow_redirects=False).status_code
+
+    def post(self, path: str, data: dict) -> int:
+        return self.session.post(self.url + path, data=data, allow_redirects=False).status_code
+
+
+def pick_path(route: str, rng: random.Random, users: int, media: list) -> str:
+    if route == "my_feed":
+        return "/my_feed"
+    if route == "my_profile":
+        return "/my_profile"
+    if route == "discover":
+        return "/discover"
+    if route == "media":
+        return f"/media/{rng.choice(media)}"
+    # a prefix of a synthetic user name, e.g. "load12"
+    return f"/search_users?search_term=load{rng.randint(1, max(users // 100, 1))}"
+
+
+def run(make_driver, emails: list, media: list, concurrency: int, duration: float, warmup: float) -> dict:
+    """Run concurrency logged-in workers for warmup + duration seconds; time the last duration seconds"""
+    routes = list(ROUTE_WEIGHTS)
+    weights = [ROUTE_WEIGHTS[route] for route in routes]
+    timings = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+    lock = threading.Lock()
+    login_failures = []
+    ready = threading.Barrier(concurrency + 1)
+    started = threading.Event()
+    stop = threading.Event()
+    measuring = threading.Event()
+
+    def worker(n: int):
+        rng = random.Random(n)
+        driver = make_driver()
+        # a successful login redirects to the feed
+        if driver.post("/login", {"Email": emails[n % len(emails)], "PWord": LOAD_PASSWORD}) != 302:
+            login_failures.append(emails[n % len(emails)])
+        ready.wait()
+        started.wait()
+        while not stop.is_set():
+            route = rng.choices(routes, weights)[0]
+            path = pick_path(route, rng, len(emails), media)
+            start = time.perf_counter()
+            try:
+                failed = driver.get(path) >= 300
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - start
+            if measuring.is_set():
+                with lock:
+                    timings[route].append(elapsed)
+                    errors[route] += failed
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # logins hash passwords; keep them out of the timed window
+    ready.wait()
+    if login_failures:
+        stop.set()
+        started.set()
+        sys.exit(f"Could not log in as {len(login_failures)} synthetic users, e.g. {login_failures[0]}; run with --seed first")
+    started.set()
+    time.sleep(warmup)
+    measuring.set()
+    time.sleep(duration)
+    measuring.clear()
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    everything = [t for route in routes for t in timings[route]]
+    return {
+        "routes": {route: summarize(timings[route], errors[route], duration) for route in routes},
+        "total": summarize(everything, sum(errors.values()), duration),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions of results against baseline, as readable lines"""
+    regressions = []
+    for route, before in baseline["routes"].items():
+        after = results["routes"].get(route)
+        if not after or not before["p95_ms"]:
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {before['p95_ms']:.1f} -> {after['p95_ms']:.1f} ms")
+    before, after = baseline["total"]["rps"], results["total"]["rps"]
+    if before and after < before * (1 - tolerance):
+        regressions.append(f"total: {before:.1f} -> {after:.1f} requests/s")
+    return regressions
+
+
+def print_results(results: dict, baseline: dict = None) -> None:
+    print(f"\n{'route':<14}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          + (f"{'base p95':>10}" if baseline else ""))
+    for route, row in list(results["routes"].items()) + [("total", results["total"])]:
+        line = (f"{route:<14}{row['requests']:>10}{row['errors']:>8}{row['rps']:>9.1f}"
+                f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}")
+        if baseline:
+            before = baseline["total"] if route == "total" else baseline["routes"].get(route)
+            line += f"{before['p95_ms']:>10.1f}" if before else f"{'-':>10}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the logged-in pages against a seeded database")
+    parser.add_argument("--seed", type=int, default=0, metavar="USERS", help="first add this many synthetic users and their data")
+    parser.add_argument("--concurrency", type=int, default=8, help="workers, each logged in as its own user")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to measure; 0 only seeds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds to run before measuring")
+    parser.add_argument("--url", help="drive a running server at this URL instead of an in-process app")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="flag regressions against this baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth / throughput drop (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    app = None
+    if not args.url:
+        from app import create_app
+        # builds the tables in a fresh database before seeding
+        app = create_app()
+
+    if args.seed:
+        start = time.perf_counter()
+        seed_database(args.seed, password=LOAD_PASSWORD, prefix="load", domain="load.test")
+        print(f"Seeded {args.seed} users in {time.perf_counter() - start:.1f}s")
+    if args.duration <= 0:
+        return
+
+    emails, media = load_ids()
+    if not emails or not media:
+        sys.exit("No synthetic users in this database; run with --seed first")
+    make_driver = (lambda: HttpDriver(args.url)) if args.url else (lambda: ClientDriver(app))
+    results = run(make_driver, emails, media, args.concurrency, args.duration, args.warmup)
+    results["meta"] = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "target": args.url or "in-process",
+        "users": len(emails),
+        "media": len(media),
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    if baseline:
+        if baseline.get("meta", {}).get("users") != len(emails):
+            print(f"\nNote: the baseline was measured with {baseline['meta'].get('users')} users, this run with {len(emails)}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions over {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""compression.py: gzip/brotli compression of responses as they stream out
+
+CompressionMiddleware wraps the Flask WSGI app. For a client that sends
+Accept-Encoding: br or gzip it compresses responses whose type is text (HTML,
+JSON, CSS, JavaScript, SVG, ...) chunk by chunk as the app yields them, so a large
+page is never held in memory twice. It leaves alone:
+    responses smaller than compress_min_size bytes (the headers cost more than they save)
+    responses that are already encoded, such as the precompressed files in /static/dist/
+    images, video, archives and every other type not in COMPRESSIBLE_TYPES
+    HEAD requests, 204/304 responses and anything marked Cache-Control: no-transform
+    partial responses (206, or any with a Content-Range)
+
+Responses streamed without a Content-Length are flushed after every chunk, so the
+client still sees each chunk as soon as the app produces it.
+"""
+import os
+import zlib
+from dotenv import load_dotenv
+from werkzeug.http import parse_accept_header, parse_cache_control_header
+
+# Load environment variables from .env
+load_dotenv()
+
+compress_responses = os.getenv('compress_responses', 'true').lower() in ('1', 'true', 'yes')
+compress_min_size = int(os.getenv('compress_min_size', '500'))
+# zlib level 1-9 and brotli quality 0-11; past these the CPU cost outgrows the savings on dynamic pages
+compress_gzip_level = int(os.getenv('compress_gzip_level', '6'))
+compress_brotli_quality = int(os.getenv('compress_brotli_quality', '4'))
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'application/xhtml+xml', 'image/svg+xml')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class _GzipStream:
+    def __init__(self):
+        # wbits 31: a gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(compress_gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=compress_brotli_quality, mode=brotli.MODE_TEXT)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+# best first: Accept-Encoding token -> compressor
+ENCODERS = {"gzip": _GzipStream}
+if brotli is not None:
+    ENCODERS = {"br": _BrotliStream, **ENCODERS}
+
+
+def choose_encoding(accept_encoding: str):
+    """The best encoding the client accepts, or None"""
+    accepted = parse_accept_header(accept_encoding)
+    for encoding in ENCODERS:
+        if accepted.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+def _should_compress(status: str, headers: list) -> bool:
+    values = {}
+    for name, value in headers:
+        values[name.lower()] = value
+    # a range is a slice of the uncompressed body; its Content-Range would not describe the compressed one
+    if status[:3] in ('204', '206', '304') or 'content-encoding' in values or 'content-range' in values:
+        return False
+    if not values.get('content-type', '').startswith(COMPRESSIBLE_TYPES):
+        return False
+    if 'no-transform' in parse_cache_control_header(values.get('cache-control', '')):
+        return False
+    length = values.get('content-length')
+    return length is None or int(length) >= compress_min_size
+
+
+class CompressionMiddleware:
+    """WSGI middleware compressing responses with the best encoding the client accepts"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        response = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            if _should_compress(status, headers):
+                response['streamed'] = not any(name.lower() == 'content-length' for name, _ in headers)
+                # byte offsets into a stream compressed on the fly mean nothing to the client
+                headers = [(name, value) for name, value in headers if name.lower() not in ('content-length', 'accept-ranges')]
+                for i, (name, value) in enumerate(headers):
+                    # the compressed body is a different byte sequence: a strong ETag would be a lie
+                    if name.lower() == 'etag' and not value.startswith('W/'):
+                        headers[i] = (name, 'W/' + value)
+                headers.append(('Content-Encoding', encoding))
+                response['encoding'] = encoding
+            if any(value.startswith(COMPRESSIBLE_TYPES) for name, value in headers if name.lower() == 'content-type'):
+                vary = [value for name, value in headers if name.lower() == 'vary']
+                if not any('accept-encoding' in value.lower() for value in vary):
+                    headers.append(('Vary', 'Accept-Encoding'))
+            return start_response(status, headers, exc_info)
+
+        body = self.app(environ, compressing_start_response)
+        if 'encoding' not in response:
+            return body
+        return self._compress(body, ENCODERS[response['encoding']](), response['streamed'])
+
+    @staticmethod
+    def _compress(body, stream, flush_every_chunk: bool):
+        try:
+            for chunk in body:
+                data = stream.compress(chunk)
+                if flush_every_chunk:
+                    data += stream.flush()
+                if data:
+                    yield data
+            yield stream.finish()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+
+def init_compression(app) -> None:
+    """Compress the responses of app (unless compress_responses=false)"""
+    if compress_responses:
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app)
@@ -0,0 +1,181 @@
+"""async_query.py: asyncio counterparts of the read queries in query.py
+
+Routes that need several independent queries start them together and wait for
+all of them, so a page takes as long as its slowest query instead of the sum:
+
+    suggested, following = async_query.run_all(
+        async_query.get_all_users_except_current(userid),
+        async_query.get_following(userid))
+
+The queries run on an asyncpg pool, on one event loop that lives in a background
+thread for the life of the process; asyncpg connections belong to the loop that
+opened them, so the loop and its pool are shared by every request. They reuse
+the text() statements from query.py, compiled once to asyncpg's $1 placeholders.
+Each query gets its own connection and is read-only: it does not see writes the
+request's session (query.get_session) hasn't committed yet, so only use these on
+requests that have not written anything (a POST that writes redirects first).
+
+The pool is kept small (db_async_pool_size, separate from the SQLAlchemy pool's
+db_pool_size): a page runs a handful of queries at once, and every connection
+here counts against the database's max_connections for every worker.
+"""
+import asyncio
+import threading
+from time import perf_counter
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql.asyncpg import dialect as asyncpg_dialect
+import db.query as query
+from db.server import record_statements, db_owner, db_pass, db_host, db_port, db_name, db_pool_min, db_async_pool_size, db_pool_recycle
+
+_pool = None
+_pool_options = {}
+_loop = None
+_loop_lock = threading.Lock()
+# text() statement -> (sql with $n placeholders, parameter names in $n order)
+_compiled = {}
+
+
+def init_pool(**options) -> None:
+    """Set extra asyncpg.create_pool options (e.g. server_settings); call before the first query"""
+    _pool_options.update(options)
+
+
+async def _create_pool():
+    settings = {
+        # an empty db_host lets asyncpg fall back to PGHOST, like libpq
+        "host": db_host or None,
+        "port": int(db_port),
+        "user": db_owner,
+        "password": db_pass,
+        "database": db_name,
+        "min_size": min(max(db_pool_min, 1), db_async_pool_size),
+        "max_size": db_async_pool_size,
+        "max_inactive_connection_lifetime": db_pool_recycle,
+    }
+    settings.update(_pool_options)
+    return await asyncpg.create_pool(**settings)
+
+
+def _get_loop():
+    """Start the background event loop and its connection pool on first use
+
+    If the pool can't be created (the database is down) the loop is stopped
+    again and the error raised; the next call tries again from scratch.
+    """
+    global _loop, _pool
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="async-query-loop", daemon=True)
+            thread.start()
+            try:
+                _pool = asyncio.run_coroutine_threadsafe(_create_pool(), loop).result()
+            except BaseException:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join()
+                loop.close()
+                raise
+            _loop = loop
+    return _loop
+
+
+def pool_status() -> dict:
+    """Connections in the asyncpg pool; all zero until the first async query"""
+    if _pool is None:
+        return {"size": 0, "idle": 0, "max_size": db_async_pool_size}
+    return {"size": _pool.get_size(), "idle": _pool.get_idle_size(), "max_size": _pool.get_max_size()}
+
+
+def warm_up() -> None:
+    """Start the event loop and open the pool's first db_pool_min connections now instead of on the first query"""
+    _get_loop()
+
+
+def run_all(*coroutines) -> list:
+    """Run the coroutines concurrently and return their results in order"""
+    async def gather():
+        return await asyncio.gather(*coroutines)
+    start = perf_counter()
+    results = asyncio.run_coroutine_threadsafe(gather(), _get_loop()).result()
+    # counted as one wait: the statements overlap, so their times don't add up
+    record_statements(len(coroutines), perf_counter() - start)
+    return results
+
+
+def run(coroutine):
+    """Run one coroutine and return its result"""
+    return run_all(coroutine)[0]
+
+
+def _compile(statement):
+    """Turn a text() statement with :named parameters into asyncpg's $n form"""
+    if statement not in _compiled:
+        compiled = statement.compile(dialect=asyncpg_dialect())
+        _compiled[statement] = (compiled.string, compiled.positiontup)
+    return _compiled[statement]
+
+
+async def _fetch(statement, params: dict, error: str, default=None, raise_errors: bool = False):
+    """Execute a statement on a pooled connection and return its rows as dicts
+
+    On failure returns default, or raises with raise_errors=True.
+    """
+    sql, names = _compile(statement)
+    try:
+        async with _pool.acquire() as connection:
+            rows = await connection.fetch(sql, *[params[name] for name in names])
+            return [dict(row) for row in rows]
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"Error {error}: {e}")
+        return default
+
+
+USER_QUERY = text('SELECT "UserID", "UName", "FName", "LName" FROM "user" WHERE "UserID" = :user_id')
+
+async def get_all_users_except_current(user_id: int) -> list:
+    """Get all users except the current user for follow suggestions"""
+    return await _fetch(query.SUGGESTED_USERS_QUERY, {"user_id": user_id}, "getting users", [])
+
+async def get_following(user_id: int) -> list:
+    """Get users that the current user is following"""
+    return await _fetch(query.FOLLOWING_QUERY, {"user_id": user_id}, "getting following list", [])
+
+async def get_followers(user_id: int) -> list:
+    """Get users who are following the current user"""
+    return await _fetch(query.FOLLOWERS_QUERY, {"user_id": user_id}, "getting followers list", [])
+
+async def checkFollowing(userid: int, otheruserid: int) -> bool:
+    """Check if a user is following another user"""
+    rows = await _fetch(query.CHECK_FOLLOWING_QUERY, {"userid": userid, "otheruserid": otheruserid}, "checking following", [])
+    return bool(rows)
+
+async def getUser(userid: int):
+    """Get a user's UserID, UName, FName and LName, or None"""
+    rows = await _fetch(USER_QUERY, {"user_id": userid}, "getting user")
+    return rows[0] if rows else None
+
+async def getUserLists(userid: int) -> dict:
+    """Return the TV/movies a user has watched, is watching and wants to watch"""
+    lists = {table: [] for table in query.WATCH_TABLES}
+    for media in await _fetch(query.USER_LISTS_QUERY, {"user_id": userid}, "getting user lists", []):
+        lists[media.pop("list")].append(media)
+    return lists
+
+# the media page functions take raise_errors so a page about to be cached can tell a failure from no rows
+
+async def getMediaInfo(mediaid: int, raise_errors: bool = False):
+    """Get all information about a given media"""
+    rows = await _fetch(query.MEDIA_INFO_QUERY, {"mediaid": mediaid}, "getting media info", raise_errors=raise_errors)
+    return rows[0] if rows else None
+
+async def getMediaPosts(mediaid: int, raise_errors: bool = False) -> list:
+    """Get all posts for a given media"""
+    return await _fetch(query.MEDIA_POSTS_QUERY, {"mediaid": mediaid}, "getting media posts", raise_errors=raise_errors)
+
+async def getMediaStats(mediaid: int, raise_errors: bool = False):
+    """Get the post count, average rating and rating histogram of a given media"""
+    rows = await _fetch(query.MEDIA_STATS_QUERY, {"mediaid": mediaid}, "getting media stats", raise_errors=raise_errors)
+    return rows[0] if rows else None
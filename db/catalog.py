@@ -0,0 +1,70 @@
+"""catalog.py: in-process cache of the TVMovie catalog
+
+The catalog is read far more often than it changes, so each worker keeps a copy in
+memory. A database trigger bumps catalog_version whenever tvmovie changes; the cache
+checks that counter at most every catalog_check_interval seconds and reloads the
+titles only when it moved.
+"""
+import os
+import threading
+from bisect import bisect_left
+from time import monotonic
+from dotenv import load_dotenv
+import db.query as query
+
+# Load environment variables from .env
+load_dotenv()
+
+# seconds between checks of the catalog version
+catalog_check_interval = float(os.getenv('catalog_check_interval', '5'))
+
+
+class CatalogCache:
+    """Copy of the catalog, reloaded when the catalog version changes"""
+
+    def __init__(self, check_interval: float = catalog_check_interval):
+        self.check_interval = check_interval
+        self.version = None
+        self.checked_at = None
+        # (media dicts ordered by lowercase title, the lowercase titles for bisect),
+        # swapped as one tuple so readers never see a half-reloaded catalog
+        self._entries = ([], [])
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        """Reload the catalog if the version changed since the last check"""
+        now = monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self.checked_at is not None and now - self.checked_at < self.check_interval:
+                return
+            version = query.getCatalogVersion()
+            # without a version (migration not applied yet) reload on every check
+            if version is None or version != self.version:
+                media = sorted(query.getCatalog(), key=lambda m: (m["Title"] or "").lower())
+                self._entries = (media, [(m["Title"] or "").lower() for m in media])
+                self.version = version
+            self.checked_at = now
+
+    def invalidate(self) -> None:
+        """Force a version check on the next read"""
+        self.checked_at = None
+
+    def search(self, prefix: str, limit: int = 10) -> list:
+        """Return up to limit titles starting with prefix (case-insensitive), ordered by title"""
+        self._refresh()
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        media, keys = self._entries
+        results = []
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and len(results) < limit and keys[i].startswith(prefix):
+            results.append(media[i])
+            i += 1
+        return results
+
+
+# shared by every request in this process
+catalog = CatalogCache()
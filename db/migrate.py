@@ -0,0 +1,115 @@
+"""migrate.py: apply the SQL migrations in db/migrations to an existing database
+
+Base.metadata.create_all only creates missing tables, it never changes a table that
+already exists. Schema changes to existing tables (keys, indexes, constraints) are
+written as numbered .sql files in db/migrations and applied here in order. Every
+migration is recorded in the schema_migrations table so it only runs once.
+
+Foreign keys added to big tables are added NOT VALID, which skips checking the
+existing rows and so only locks the table for a moment. validate_constraints()
+checks them afterwards, each in its own transaction, under a SHARE UPDATE
+EXCLUSIVE lock that lets reads and writes carry on.
+
+usage:
+    python -m db.migrate
+"""
+import os
+from sqlalchemy import text
+from db.server import Base, engine
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+# key for pg_advisory_xact_lock so that only one worker applies migrations at a time
+MIGRATION_LOCK_ID = 5138297
+# and for pg_try_advisory_lock so that only one worker validates constraints at a time
+VALIDATION_LOCK_ID = 5138298
+
+def list_migrations() -> list:
+    """Return the migration file names in the order they are applied"""
+    return sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith('.sql'))
+
+def run_sql_file(connection, path: str) -> None:
+    """Run every statement in a .sql file on an open connection, inside its transaction"""
+    with open(path) as f:
+        sql = f.read()
+    # the raw DBAPI cursor, so % in the SQL is never treated as a parameter marker
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(sql)
+    finally:
+        cursor.close()
+
+def apply_migrations() -> list:
+    """Apply every migration that has not been applied yet
+
+        returns:
+            applied (list[str]): file names of the migrations applied by this call
+    """
+    applied = []
+    # one transaction: a failing migration leaves the database untouched
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+        connection.execute(text(
+            """
+            CREATE TABLE IF NOT EXISTS "schema_migrations" (
+                "Version" VARCHAR(100) PRIMARY KEY,
+                "AppliedAt" TIMESTAMP NOT NULL DEFAULT now()
+            )
+            """))
+        done = set(connection.execute(text('SELECT "Version" FROM "schema_migrations"')).scalars())
+
+        for name in list_migrations():
+            if name in done:
+                continue
+            run_sql_file(connection, os.path.join(MIGRATIONS_DIR, name))
+            connection.execute(text('INSERT INTO "schema_migrations" ("Version") VALUES (:version)'), {"version": name})
+            applied.append(name)
+    validate_constraints()
+    return applied
+
+def validate_constraints() -> list:
+    """Validate the foreign keys left NOT VALID by migrations, one transaction each
+
+    Skipped when another worker is already validating. A key whose existing rows
+    don't hold stays NOT VALID (new rows are still checked) and is reported.
+
+        returns:
+            validated (list[str]): "table.constraint" of every key validated by this call
+    """
+    validated = []
+    with engine.connect() as connection:
+        if not connection.execute(text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": VALIDATION_LOCK_ID}).scalar():
+            connection.rollback()
+            return validated
+        connection.commit()
+        try:
+            keys = connection.execute(text(
+                """
+                SELECT conrelid::regclass::text AS table_name, conname
+                FROM pg_constraint WHERE contype = 'f' AND NOT convalidated
+                """)).all()
+            connection.commit()
+            for key in keys:
+                try:
+                    connection.execute(text(f'ALTER TABLE {key.table_name} VALIDATE CONSTRAINT "{key.conname}"'))
+                    connection.commit()
+                    validated.append(f"{key.table_name}.{key.conname}")
+                except Exception as e:
+                    connection.rollback()
+                    print(f" * Could not validate {key.table_name}.{key.conname}: {e}")
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": VALIDATION_LOCK_ID})
+            connection.commit()
+    return validated
+
+if __name__ == "__main__":
+    # migrations run after create_all, so new tables exist before they are filled
+    import db.schema
+    Base.metadata.create_all(bind=engine)
+
+    applied = apply_migrations()
+    if applied:
+        for name in applied:
+            print(f" * Applied {name}")
+    else:
+        print(" * Database is up to date")
@@ -0,0 +1,97 @@
+-- 001_association_keys.sql: primary keys on the association tables, unique
+-- email/user name and indexes on the lookup columns.
+--
+-- Safe to run against a database created by an older version of the app as
+-- well as one created by Base.metadata.create_all (every step is idempotent).
+-- Rows that would violate the new keys are removed first: association rows
+-- with a NULL key and exact duplicate association rows.
+
+-- follows
+DELETE FROM "follows" WHERE "UserID" IS NULL OR "FollowerID" IS NULL;
+DELETE FROM "follows" d USING "follows" k
+WHERE d.ctid > k.ctid AND d."UserID" = k."UserID" AND d."FollowerID" = k."FollowerID";
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = '"follows"'::regclass AND contype = 'p') THEN
+        ALTER TABLE "follows" ADD CONSTRAINT "follows_pkey" PRIMARY KEY ("UserID", "FollowerID");
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS "ix_follows_follower" ON "follows" ("FollowerID", "UserID");
+
+-- creates
+DELETE FROM "creates" WHERE "UserID" IS NULL OR "PostID" IS NULL;
+DELETE FROM "creates" d USING "creates" k
+WHERE d.ctid > k.ctid AND d."UserID" = k."UserID" AND d."PostID" = k."PostID";
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = '"creates"'::regclass AND contype = 'p') THEN
+        ALTER TABLE "creates" ADD CONSTRAINT "creates_pkey" PRIMARY KEY ("UserID", "PostID");
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS "ix_creates_post" ON "creates" ("PostID");
+
+-- makes
+DELETE FROM "makes" WHERE "UserID" IS NULL OR "CommentID" IS NULL;
+DELETE FROM "makes" d USING "makes" k
+WHERE d.ctid > k.ctid AND d."UserID" = k."UserID" AND d."CommentID" = k."CommentID";
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = '"makes"'::regclass AND contype = 'p') THEN
+        ALTER TABLE "makes" ADD CONSTRAINT "makes_pkey" PRIMARY KEY ("UserID", "CommentID");
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS "ix_makes_comment" ON "makes" ("CommentID");
+
+-- watched
+DELETE FROM "watched" WHERE "UserID" IS NULL OR "MediaID" IS NULL;
+DELETE FROM "watched" d USING "watched" k
+WHERE d.ctid > k.ctid AND d."UserID" = k."UserID" AND d."MediaID" = k."MediaID";
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = '"watched"'::regclass AND contype = 'p') THEN
+        ALTER TABLE "watched" ADD CONSTRAINT "watched_pkey" PRIMARY KEY ("UserID", "MediaID");
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS "ix_watched_media" ON "watched" ("MediaID");
+
+-- watching
+DELETE FROM "watching" WHERE "UserID" IS NULL OR "MediaID" IS NULL;
+DELETE FROM "watching" d USING "watching" k
+WHERE d.ctid > k.ctid AND d."UserID" = k."UserID" AND d."MediaID" = k."MediaID";
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = '"watching"'::regclass AND contype = 'p') THEN
+        ALTER TABLE "watching" ADD CONSTRAINT "watching_pkey" PRIMARY KEY ("UserID", "MediaID");
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS "ix_watching_media" ON "watching" ("MediaID");
+
+-- watchlist
+DELETE FROM "watchlist" WHERE "UserID" IS NULL OR "MediaID" IS NULL;
+DELETE FROM "watchlist" d USING "watchlist" k
+WHERE d.ctid > k.ctid AND d."UserID" = k."UserID" AND d."MediaID" = k."MediaID";
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = '"watchlist"'::regclass AND contype = 'p') THEN
+        ALTER TABLE "watchlist" ADD CONSTRAINT "watchlist_pkey" PRIMARY KEY ("UserID", "MediaID");
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS "ix_watchlist_media" ON "watchlist" ("MediaID");
+
+-- user: emails and user names must be unique before the unique indexes can be built
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM "user" WHERE "Email" IS NOT NULL GROUP BY "Email" HAVING count(*) > 1) THEN
+        RAISE EXCEPTION 'duplicate emails in table "user": resolve them before applying 001_association_keys';
+    END IF;
+    IF EXISTS (SELECT 1 FROM "user" WHERE "UName" IS NOT NULL GROUP BY "UName" HAVING count(*) > 1) THEN
+        RAISE EXCEPTION 'duplicate user names in table "user": resolve them before applying 001_association_keys';
+    END IF;
+END $$;
+CREATE UNIQUE INDEX IF NOT EXISTS "ux_user_email" ON "user" ("Email");
+CREATE UNIQUE INDEX IF NOT EXISTS "ux_user_uname" ON "user" ("UName");
+
+-- lookup columns
+CREATE INDEX IF NOT EXISTS "ix_tvmovie_title" ON "tvmovie" ("Title");
+CREATE INDEX IF NOT EXISTS "ix_post_media" ON "post" ("MediaID");
+CREATE INDEX IF NOT EXISTS "ix_comment_post" ON "comment" ("PostID");
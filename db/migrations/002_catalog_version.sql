@@ -0,0 +1,22 @@
+-- 002_catalog_version.sql: a counter that changes whenever the tvmovie catalog does.
+--
+-- Every worker keeps the catalog in memory (db/catalog.py) and only reloads it
+-- when this version moves, whichever process or script changed the titles.
+
+CREATE TABLE IF NOT EXISTS "catalog_version" (
+    "ID" INTEGER PRIMARY KEY CHECK ("ID" = 1),
+    "Version" BIGINT NOT NULL
+);
+INSERT INTO "catalog_version" ("ID", "Version") VALUES (1, 1) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE "catalog_version" SET "Version" = "Version" + 1 WHERE "ID" = 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "tvmovie_catalog_version" ON "tvmovie";
+CREATE TRIGGER "tvmovie_catalog_version"
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "tvmovie"
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
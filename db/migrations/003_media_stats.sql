@@ -0,0 +1,24 @@
+-- 003_media_stats.sql: fill media_stats from the posts that already exist.
+--
+-- From here on createPost and deletePost keep the totals up to date.
+
+INSERT INTO "media_stats" ("MediaID", "PostCount", "RatedCount", "RatingSum", "Rating1", "Rating2", "Rating3", "Rating4")
+SELECT "MediaID",
+    count(*),
+    count("Rating"),
+    COALESCE(sum("Rating"), 0),
+    count(*) FILTER (WHERE "Rating" = 1),
+    count(*) FILTER (WHERE "Rating" = 2),
+    count(*) FILTER (WHERE "Rating" = 3),
+    count(*) FILTER (WHERE "Rating" = 4)
+FROM "post"
+WHERE "MediaID" IS NOT NULL
+GROUP BY "MediaID"
+ON CONFLICT ("MediaID") DO UPDATE SET
+    "PostCount" = EXCLUDED."PostCount",
+    "RatedCount" = EXCLUDED."RatedCount",
+    "RatingSum" = EXCLUDED."RatingSum",
+    "Rating1" = EXCLUDED."Rating1",
+    "Rating2" = EXCLUDED."Rating2",
+    "Rating3" = EXCLUDED."Rating3",
+    "Rating4" = EXCLUDED."Rating4";
@@ -0,0 +1,22 @@
+-- 004_user_search.sql: indexes for query.search_users.
+--
+-- search_users matches lower(UName/FName/LName) with LIKE '%term%'. Trigram GIN
+-- indexes (pg_trgm) turn those substring matches into index scans. pg_trgm ships
+-- with PostgreSQL's contrib package; where it is missing or the database user may
+-- not create extensions, search still works but falls back to a sequential scan.
+
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm is not available, user search will not be indexed';
+END $$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        EXECUTE 'CREATE INDEX IF NOT EXISTS "ix_user_uname_trgm" ON "user" USING gin (lower("UName") gin_trgm_ops)';
+        EXECUTE 'CREATE INDEX IF NOT EXISTS "ix_user_fname_trgm" ON "user" USING gin (lower("FName") gin_trgm_ops)';
+        EXECUTE 'CREATE INDEX IF NOT EXISTS "ix_user_lname_trgm" ON "user" USING gin (lower("LName") gin_trgm_ops)';
+    END IF;
+END $$;
@@ -0,0 +1,76 @@
+-- 005_cascade_deletes.sql: ON DELETE CASCADE on the keys that point at posts,
+-- comments, users and titles from tables that only link or describe them.
+--
+-- Deleting a post then removes its comments (and their makes rows), its creates
+-- row and its timeline entries in the same statement; deleting a user removes
+-- their follows, list entries, sessions and timeline. Posts and comments are
+-- never removed by a cascade from "user": purgeUser deletes them in batches.
+--
+-- Every key is replaced whatever it was named; keys that already cascade (a
+-- database created by Base.metadata.create_all) are left alone.
+--
+-- The new keys are added NOT VALID: adding one only takes a brief lock, while
+-- checking the existing rows would hold an ACCESS EXCLUSIVE lock on tables as
+-- big as timeline and follows for the whole scan. apply_migrations validates them
+-- afterwards, one transaction per key, under a lock that lets reads and writes go on.
+
+-- the cascade from "user" looks sessions up by UserID
+CREATE INDEX IF NOT EXISTS "ix_user_session_user" ON "user_session" ("UserID");
+
+DO $$
+DECLARE
+    fk RECORD;
+    existing RECORD;
+BEGIN
+    CREATE TEMPORARY TABLE cascade_keys (table_name text, column_name text, ref_table text, ref_column text) ON COMMIT DROP;
+    INSERT INTO cascade_keys
+    SELECT keys.* FROM (VALUES
+        ('comment', 'PostID', 'post', 'PostID'),
+        ('creates', 'PostID', 'post', 'PostID'),
+        ('creates', 'UserID', 'user', 'UserID'),
+        ('makes', 'CommentID', 'comment', 'CommentID'),
+        ('makes', 'UserID', 'user', 'UserID'),
+        ('timeline', 'PostID', 'post', 'PostID'),
+        ('timeline', 'UserID', 'user', 'UserID'),
+        ('follows', 'UserID', 'user', 'UserID'),
+        ('follows', 'FollowerID', 'user', 'UserID'),
+        ('watched', 'UserID', 'user', 'UserID'),
+        ('watched', 'MediaID', 'tvmovie', 'MediaID'),
+        ('watching', 'UserID', 'user', 'UserID'),
+        ('watching', 'MediaID', 'tvmovie', 'MediaID'),
+        ('watchlist', 'UserID', 'user', 'UserID'),
+        ('watchlist', 'MediaID', 'tvmovie', 'MediaID'),
+        ('user_session', 'UserID', 'user', 'UserID'),
+        ('media_stats', 'MediaID', 'tvmovie', 'MediaID')
+    ) AS keys (table_name, column_name, ref_table, ref_column)
+    -- keys that already cascade are left alone
+    WHERE NOT EXISTS (
+        SELECT 1 FROM pg_constraint c
+        JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+        WHERE c.contype = 'f' AND c.conrelid = format('%I', keys.table_name)::regclass
+          AND a.attname = keys.column_name AND c.confdeltype = 'c'
+    );
+
+    -- first, while only row locks are held: rows pointing at something already
+    -- deleted would make the new key fail validation
+    FOR fk IN SELECT * FROM cascade_keys LOOP
+        EXECUTE format('DELETE FROM %I t WHERE t.%I IS NOT NULL AND NOT EXISTS (SELECT 1 FROM %I r WHERE r.%I = t.%I)',
+                       fk.table_name, fk.column_name, fk.ref_table, fk.ref_column, fk.column_name);
+    END LOOP;
+
+    -- then swap the keys; NOT VALID skips the scan of the existing rows
+    FOR fk IN SELECT * FROM cascade_keys LOOP
+        FOR existing IN
+            SELECT c.conname FROM pg_constraint c
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+            WHERE c.contype = 'f' AND c.conrelid = format('%I', fk.table_name)::regclass
+              AND a.attname = fk.column_name
+        LOOP
+            EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', fk.table_name, existing.conname);
+        END LOOP;
+
+        EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I FOREIGN KEY (%I) REFERENCES %I (%I) ON DELETE CASCADE NOT VALID',
+                       fk.table_name, fk.table_name || '_' || fk.column_name || '_fkey',
+                       fk.column_name, fk.ref_table, fk.ref_column);
+    END LOOP;
+END $$;
@@ -0,0 +1,87 @@
+-- 006_media_version.sql: a counter per title that changes whenever its media page does.
+--
+-- Every worker keeps the rendered header and post cards of a media page in memory
+-- (fragment_cache.py), keyed by this version, so a post or comment written by any
+-- process or script invalidates every worker's copy. Posts, comments and the rows
+-- tying them to their authors bump the version of their title when added or removed,
+-- cascades included; statement triggers bump each title once per statement, so COPY
+-- and batch deletes stay cheap.
+
+CREATE TABLE IF NOT EXISTS "media_version" (
+    "MediaID" INTEGER PRIMARY KEY REFERENCES "tvmovie" ("MediaID") ON DELETE CASCADE,
+    "Version" BIGINT NOT NULL
+);
+
+-- titles are bumped in MediaID order so two statements never wait on each other's rows
+CREATE OR REPLACE FUNCTION bump_media_version_for_posts() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO "media_version" ("MediaID", "Version")
+    SELECT DISTINCT "MediaID", 1 FROM changed WHERE "MediaID" IS NOT NULL ORDER BY 1
+    ON CONFLICT ("MediaID") DO UPDATE SET "Version" = "media_version"."Version" + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_media_version_for_comments() RETURNS trigger AS $$
+BEGIN
+    -- comments deleted along with their post find no post here; the post's own trigger bumps its title
+    INSERT INTO "media_version" ("MediaID", "Version")
+    SELECT DISTINCT P."MediaID", 1 FROM changed JOIN "post" P ON P."PostID" = changed."PostID"
+    WHERE P."MediaID" IS NOT NULL ORDER BY 1
+    ON CONFLICT ("MediaID") DO UPDATE SET "Version" = "media_version"."Version" + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- authors deleted outright (not through purgeUser) take their creates and makes rows with them
+CREATE OR REPLACE FUNCTION bump_media_version_for_creates() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO "media_version" ("MediaID", "Version")
+    SELECT DISTINCT P."MediaID", 1 FROM changed JOIN "post" P ON P."PostID" = changed."PostID"
+    WHERE P."MediaID" IS NOT NULL ORDER BY 1
+    ON CONFLICT ("MediaID") DO UPDATE SET "Version" = "media_version"."Version" + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_media_version_for_makes() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO "media_version" ("MediaID", "Version")
+    SELECT DISTINCT P."MediaID", 1 FROM changed
+    JOIN "comment" C ON C."CommentID" = changed."CommentID"
+    JOIN "post" P ON P."PostID" = C."PostID"
+    WHERE P."MediaID" IS NOT NULL ORDER BY 1
+    ON CONFLICT ("MediaID") DO UPDATE SET "Version" = "media_version"."Version" + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "post_media_version_insert" ON "post";
+CREATE TRIGGER "post_media_version_insert"
+AFTER INSERT ON "post" REFERENCING NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION bump_media_version_for_posts();
+
+DROP TRIGGER IF EXISTS "post_media_version_delete" ON "post";
+CREATE TRIGGER "post_media_version_delete"
+AFTER DELETE ON "post" REFERENCING OLD TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION bump_media_version_for_posts();
+
+DROP TRIGGER IF EXISTS "comment_media_version_insert" ON "comment";
+CREATE TRIGGER "comment_media_version_insert"
+AFTER INSERT ON "comment" REFERENCING NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION bump_media_version_for_comments();
+
+DROP TRIGGER IF EXISTS "comment_media_version_delete" ON "comment";
+CREATE TRIGGER "comment_media_version_delete"
+AFTER DELETE ON "comment" REFERENCING OLD TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION bump_media_version_for_comments();
+
+DROP TRIGGER IF EXISTS "creates_media_version_delete" ON "creates";
+CREATE TRIGGER "creates_media_version_delete"
+AFTER DELETE ON "creates" REFERENCING OLD TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION bump_media_version_for_creates();
+
+DROP TRIGGER IF EXISTS "makes_media_version_delete" ON "makes";
+CREATE TRIGGER "makes_media_version_delete"
+AFTER DELETE ON "makes" REFERENCING OLD TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION bump_media_version_for_makes();
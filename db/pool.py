@@ -0,0 +1,103 @@
+"""pool.py: connection pool that records how long requests wait for a connection
+
+Every process has its own pool, plus the asyncpg pool of db/async_query.py, so
+the most connections the app can open is
+workers * (db_pool_size + db_max_overflow + db_async_pool_size); keep that under
+the database's max_connections. pool_status() reports the numbers needed to size it.
+"""
+import threading
+from time import perf_counter
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMetrics:
+    """Counters for connection checkouts, shared by every pool in this process"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, failed: bool = False) -> None:
+        """Add one checkout that waited wait seconds"""
+        with self._lock:
+            if failed:
+                self.failures += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def reset(self) -> None:
+        """Zero the counters"""
+        with self._lock:
+            self.checkouts = 0
+            self.failures = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+
+# shared so the numbers survive engine.dispose(), which builds a new pool
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that times every checkout and counts the ones that time out"""
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record(perf_counter() - start, failed=True)
+            raise
+        pool_metrics.record(perf_counter() - start)
+        return connection
+
+
+def warm_pool(engine, connections: int) -> int:
+    """Open connections up to the given number and return them to the pool; returns how many are open"""
+    opened = []
+    try:
+        # held together so the pool can't hand the same connection back twice
+        while len(opened) < connections:
+            opened.append(engine.connect())
+            opened[-1].execute(text("SELECT 1"))
+    finally:
+        for connection in opened:
+            connection.close()
+    return engine.pool.checkedin()
+
+
+def pool_status(engine, max_overflow: int) -> dict:
+    """Current pool usage and checkout counters for this process
+
+        max_overflow (int): the max_overflow the engine was created with (db_max_overflow);
+            -1 means no limit
+    """
+    pool = engine.pool
+    capacity = pool.size() + max(max_overflow, 0)
+    checked_out = pool.checkedout()
+    status = {
+        "pool_size": pool.size(),
+        "max_overflow": max_overflow,
+        "checked_out": checked_out,
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "utilization": round(checked_out / capacity, 3) if capacity else None,
+        "checkouts": pool_metrics.checkouts,
+        "checkout_failures": pool_metrics.failures,
+        "checkout_wait_avg_ms": round(pool_metrics.wait_total * 1000 / max(pool_metrics.checkouts + pool_metrics.failures, 1), 3),
+        "checkout_wait_max_ms": round(pool_metrics.wait_max * 1000, 3),
+        "max_connections": None,
+    }
+    try:
+        with engine.connect() as connection:
+            status["max_connections"] = int(connection.execute(text("SHOW max_connections")).scalar())
+    except Exception as e:
+        print(f"Error reading max_connections: {e}")
+    return status
@@ -1,11 +1,15 @@
 """query.py: Uses SQLAlchemy to create generic queries for interacting with the Postgres database"""
-from db.server import get_session       # import get_session function from server.py
-from sqlalchemy import or_, text
+from db.server import get_session, PostgresSession       # import get_session function from server.py
+from sqlalchemy import text, bindparam
 from db.schema.comment import Comment
 from db.schema.makes import Makes
 from db.schema.post import Post
 from db.schema.creates import Creates
 from datetime import datetime
+from collections import Counter
+
+# number of posts shown per page of the feed
+FEED_PAGE_SIZE = 20
 
 def get_User(table, **filters) -> str:
     """Search table for user
@@ -42,56 +46,107 @@ def get_all(table) -> list:
         # Closes the session
         session.close()
 
-def insert(record) -> None:
+def getCatalogVersion():
+    """Return the catalog version counter, which changes whenever a TVMovie row does"""
+    session = get_session()
+    try:
+        return session.execute(text('SELECT "Version" FROM "catalog_version" WHERE "ID" = 1')).scalar()
+    except Exception as e:
+        session.rollback()
+        print(f"Error getting catalog version: {e}")
+        return None
+    finally:
+        session.close()
+
+def getCatalog() -> list:
+    """Return every TV show/movie as a dictionary, ordered by title"""
+    session = get_session()
+    try:
+        query = text(
+            """
+            SELECT "MediaID", "Title", "Genre", "Year", "Type"
+            FROM "tvmovie"
+            ORDER BY "Title"
+            """)
+        return [dict(row) for row in session.execute(query).mappings()]
+    except Exception as e:
+        session.rollback()
+        print(f"Error getting catalog: {e}")
+        return []
+    finally:
+        session.close()
+
+def insert(record) -> bool:
     """ Insert a table record using SQLAlchemy
     
         args:
             record (obj): db table record
+
+        returns:
+            inserted (bool): False if the insert failed, e.g. on a duplicate email
     """
     session = get_session()
     try:
         # Tries to add and commit the record to the current session
         session.add(record)
         session.commit()
+        return True
     except Exception as e:
         # Rollback session if error occurs
         session.rollback()
         print(f"Error inserting record: {e}")
+        return False
     finally:
         # Closes the session
         session.close()
 
-def getFeed(userid: int) -> list:
-    """ Get all posts from users that a user follows, as well as their own posts"""
+def updatePassword(userid: int, hashed_password: str) -> bool:
+    """ Replace a user's stored password hash, e.g. when it is rehashed at a new bcrypt cost """
     session = get_session()
     try:
-        query = text(
-            """
-            SELECT U2."UserID" AS userid, U2."UName" AS username, P1."PostID" AS postid, P1."Title" AS post_title, 
-                P1."Date" AS post_date, P1."Content" AS post_content, TV1."Title" AS media_title, TV1."MediaID" AS mediaid,
-                P1."Spoiler" As spoiler, P1."Rating" AS rating
-            FROM "user" U1
-            JOIN "follows" F ON U1."UserID" = F."UserID"
-            JOIN "user" U2 ON F."FollowerID" = U2."UserID"
-            JOIN "creates" C1 ON U2."UserID" = C1."UserID"
-            JOIN "post" P1 ON C1."PostID" = P1."PostID"
-            JOIN "tvmovie" TV1 ON P1."MediaID" = TV1."MediaID"
-            WHERE U1."UserID" = :user_id
+        session.execute(text('UPDATE "user" SET "PWord" = :pword WHERE "UserID" = :user_id'),
+                        {"pword": hashed_password, "user_id": userid})
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        print(f"Error updating password: {e}")
+        return False
+    finally:
+        session.close()
 
-            UNION
+def getFeed(userid: int, limit: int = FEED_PAGE_SIZE, before_date: str = None, before_postid: int = None) -> list:
+    """ Get a page of posts from users that a user follows, as well as their own posts
+
+        Posts are read from the user's precomputed timeline, newest first by (date, PostID).
+        Pass the date and PostID of the last post on the previous page as
+        before_date/before_postid to get the next page.
+    """
+    session = get_session()
+    try:
+        cursor = ""
+        params = {"user_id": userid, "limit": limit}
+        if before_date is not None and before_postid is not None:
+            cursor = """AND (T."Date", T."PostID") < (:before_date, :before_postid)"""
+            params.update({"before_date": before_date, "before_postid": int(before_postid)})
 
-            SELECT U3."UserID" AS userid, U3."UName" AS username, P2."PostID" AS postid, P2."Title" AS post_title,
-                P2."Date" AS post_date, P2."Content" AS post_content, TV2."Title", TV2."MediaID" AS mediaid,
-                P2."Spoiler" AS spoiler, P2."Rating" AS rating
-            FROM "user" U3
-            JOIN "creates" C2 ON U3."UserID" = C2."UserID"
-            JOIN "post" P2 ON C2."PostID" = P2."PostID"
-            JOIN "tvmovie" TV2 ON P2."MediaID" = TV2."MediaID"
-            WHERE U3."UserID" = :user_id
+        query = text(
+            f"""
+            SELECT U."UserID" AS userid, U."UName" AS username, P."PostID" AS postid, P."Title" AS post_title,
+                P."Date" AS post_date, P."Content" AS post_content, TV."Title" AS media_title, TV."MediaID" AS mediaid,
+                P."Spoiler" AS spoiler, P."Rating" AS rating
+            FROM "timeline" T
+            JOIN "post" P ON T."PostID" = P."PostID"
+            JOIN "creates" C ON P."PostID" = C."PostID"
+            JOIN "user" U ON C."UserID" = U."UserID"
+            JOIN "tvmovie" TV ON P."MediaID" = TV."MediaID"
+            WHERE T."UserID" = :user_id
+            {cursor}
 
-            ORDER BY post_date DESC
+            ORDER BY T."Date" DESC, T."PostID" DESC
+            LIMIT :limit
             """)
-        feed = session.execute(query, {"user_id": userid}).mappings().all()
+        feed = session.execute(query, params).mappings().all()
 
         return [dict(row) for row in feed]
     
@@ -102,51 +157,211 @@ def getFeed(userid: int) -> list:
     finally:
         session.close()
 
-def getPostComments(postid: int) -> list:
-    """ Get all comments on a post """
+def getFeedCursor(posts: list, limit: int = FEED_PAGE_SIZE):
+    """ Return the (date, PostID) cursor for the page after posts, or None if it was the last page """
+    if len(posts) < limit:
+        return None
+    return {"before_date": posts[-1]["post_date"], "before_postid": posts[-1]["postid"]}
+
+def writeTimeline(session, userid: int = None) -> int:
+    """ Regenerate timelines on an open session or connection, inside the caller's transaction
+
+        returns:
+            count (int): number of timeline rows written
+    """
+    user_filter = ""
+    params = {}
+    if userid is not None:
+        user_filter = 'WHERE "UserID" = :user_id'
+        params["user_id"] = userid
+
+    session.execute(text(f'DELETE FROM "timeline" {user_filter}'), params)
+
+    query = text(
+        f"""
+        INSERT INTO "timeline" ("UserID", "PostID", "Date")
+        SELECT "UserID", "PostID", "Date" FROM (
+            SELECT C."UserID" AS "UserID", P."PostID" AS "PostID", P."Date" AS "Date"
+            FROM "creates" C
+            JOIN "post" P ON C."PostID" = P."PostID"
+
+            UNION
+
+            SELECT F."UserID" AS "UserID", P."PostID" AS "PostID", P."Date" AS "Date"
+            FROM "follows" F
+            JOIN "creates" C ON F."FollowerID" = C."UserID"
+            JOIN "post" P ON C."PostID" = P."PostID"
+        ) entries
+        {user_filter}
+        """)
+    return session.execute(query, params).rowcount
+
+def rebuildTimeline(userid: int = None) -> int:
+    """ Regenerate one user's timeline, or every timeline when no user is given, from follows and posts
+
+        returns:
+            count (int): number of timeline rows written
+    """
+    session = get_session()
+    try:
+        count = writeTimeline(session, userid)
+        session.commit()
+        return count
+    except Exception as e:
+        session.rollback()
+        print(f"Error rebuilding timeline: {e}")
+        return 0
+    finally:
+        session.close()
+
+def getCommentsForPosts(postids: list, raise_errors: bool = False) -> dict:
+    """ Get the comments for every post on a page in one query, grouped by post ID
+
+        raise_errors (bool): raise instead of returning {} when the query fails, for
+            callers that must not mistake a failure for posts without comments
+    """
+    comments = {}
+    if not postids:
+        return comments
+
     session = get_session()
     try:
         query = text(
             """
-            SELECT U."UserID" as userid, U."UName" AS username, C."Content" AS comment_content, C."CommentID" as commentid
+            SELECT C."PostID" AS postid, U."UserID" as userid, U."UName" AS username, C."Content" AS comment_content, C."CommentID" as commentid
             FROM "comment" C
-            JOIN "post" P ON C."PostID" = P."PostID"
             JOIN "makes" M ON C."CommentID" = M."CommentID"
             JOIN "user" U ON M."UserID" = U."UserID"
-            WHERE P."PostID" = :post_id
+            WHERE C."PostID" IN :post_ids
 
             ORDER BY C."Date" DESC
-            """)
-        
-        comments = session.execute(query, {"post_id": postid}).mappings().all()
-        return [dict(row) for row in comments]
+            """).bindparams(bindparam("post_ids", expanding=True))
+
+        rows = session.execute(query, {"post_ids": [int(postid) for postid in postids]}).mappings().all()
+        for row in rows:
+            comment = dict(row)
+            comments.setdefault(comment.pop("postid"), []).append(comment)
+        return comments
     except Exception as e:
         session.rollback()
-        print(f"Error getting post comments:", e)
-        return []
+        if raise_errors:
+            raise
+        print(f"Error getting comments for posts:", e)
+        return {}
     finally:
         session.close()
 
-def getTitles(userid: int, table: str, titlename: str) -> list:
-    """ Return the title of TV/movies watched, watching, or watches """
+# the three list tables a user can add TV shows/movies to
+WATCH_TABLES = ("watched", "watching", "watchlist")
+
+USER_LISTS_QUERY = text(
+    """
+    SELECT W.list, TV."MediaID", TV."Title", TV."Genre", TV."Year", TV."Type"
+    FROM (
+        SELECT 'watched' AS list, "MediaID" FROM "watched" WHERE "UserID" = :user_id
+        UNION ALL
+        SELECT 'watching', "MediaID" FROM "watching" WHERE "UserID" = :user_id
+        UNION ALL
+        SELECT 'watchlist', "MediaID" FROM "watchlist" WHERE "UserID" = :user_id
+    ) W
+    JOIN "tvmovie" TV ON W."MediaID" = TV."MediaID"
+    ORDER BY TV."Title"
+    """)
+
+def getUserLists(userid: int) -> dict:
+    """ Return the TV/movies a user has watched, is watching and wants to watch, in one query
+
+        Returns {"watched": [...], "watching": [...], "watchlist": [...]}, each a list of
+        dicts with MediaID, Title, Genre, Year and Type ordered by title.
+    """
+    lists = {table: [] for table in WATCH_TABLES}
+    session = get_session()
+    try:
+        for row in session.execute(USER_LISTS_QUERY, {"user_id": userid}).mappings():
+            media = dict(row)
+            lists[media.pop("list")].append(media)
+        return lists
+
+    except Exception as e:
+        session.rollback()
+        print(f"Error getting user lists {e}")
+        return lists
+    finally:
+        session.close()
+
+def updateMediaStats(session, mediaid: int, rating: int, delta: int) -> None:
+    """Add (delta=1) or remove (delta=-1) one post's rating to the media_stats totals
+
+        Runs on the caller's session so the totals commit or roll back with the post itself.
+    """
+    if mediaid is None:
+        return
+    rating = int(rating) if rating not in (None, "") else None
+    query = text(
+        """
+        INSERT INTO "media_stats" AS S ("MediaID", "PostCount", "RatedCount", "RatingSum", "Rating1", "Rating2", "Rating3", "Rating4")
+        VALUES (:media_id, :delta,
+            CASE WHEN :rating IS NULL THEN 0 ELSE :delta END,
+            COALESCE(:rating, 0) * :delta,
+            CASE WHEN :rating = 1 THEN :delta ELSE 0 END,
+            CASE WHEN :rating = 2 THEN :delta ELSE 0 END,
+            CASE WHEN :rating = 3 THEN :delta ELSE 0 END,
+            CASE WHEN :rating = 4 THEN :delta ELSE 0 END)
+        ON CONFLICT ("MediaID") DO UPDATE SET
+            "PostCount" = S."PostCount" + EXCLUDED."PostCount",
+            "RatedCount" = S."RatedCount" + EXCLUDED."RatedCount",
+            "RatingSum" = S."RatingSum" + EXCLUDED."RatingSum",
+            "Rating1" = S."Rating1" + EXCLUDED."Rating1",
+            "Rating2" = S."Rating2" + EXCLUDED."Rating2",
+            "Rating3" = S."Rating3" + EXCLUDED."Rating3",
+            "Rating4" = S."Rating4" + EXCLUDED."Rating4"
+        """)
+    session.execute(query, {"media_id": int(mediaid), "rating": rating, "delta": delta})
+
+MEDIA_STATS_QUERY = text(
+    """
+    SELECT "PostCount" AS post_count, "RatedCount" AS rated_count, "AvgRating" AS avg_rating,
+        "Rating1" AS rating1, "Rating2" AS rating2, "Rating3" AS rating3, "Rating4" AS rating4
+    FROM "media_stats"
+    WHERE "MediaID" = :mediaid
+    """)
+
+def getMediaStats(mediaid: int):
+    """Get the post count, average rating and rating histogram of a given media"""
+    session = get_session()
+    try:
+        result = session.execute(MEDIA_STATS_QUERY, {"mediaid": mediaid}).mappings().first()
+        return dict(result) if result else None
+    except Exception as e:
+        session.rollback()
+        print(f"Error getting media stats: {e}")
+        return None
+    finally:
+        session.close()
+
+def getTopMedia(sort: str = "rated", limit: int = 20) -> list:
+    """Get the top rated or most reviewed media, read in order from the media_stats indexes"""
+    if sort == "reviewed":
+        order = 'S."PostCount" DESC'
+    else:
+        order = 'S."AvgRating" DESC NULLS LAST, S."PostCount" DESC'
     session = get_session()
     try:
         query = text(
             f"""
-            SELECT TV."Title" AS {titlename}
-            FROM "user" U
-            JOIN {table} W ON U."UserID" = W."UserID"
-            JOIN "tvmovie" TV ON W."MediaID" = TV."MediaID"
-            WHERE W."UserID" = :user_id         
-            """
-        )
-        titles = session.execute(query, {"user_id": userid}).mappings().all()
-        return [row[titlename] for row in titles]
-    
+            SELECT TV."MediaID" AS mediaid, TV."Title" AS media_title, TV."Genre" AS media_genre, TV."Year" AS media_year,
+                TV."Type" AS media_type, S."PostCount" AS post_count, S."AvgRating" AS avg_rating
+            FROM "media_stats" S
+            JOIN "tvmovie" TV ON S."MediaID" = TV."MediaID"
+            WHERE S."PostCount" > 0
+            ORDER BY {order}
+            LIMIT :limit
+            """)
+        return [dict(row) for row in session.execute(query, {"limit": limit}).mappings()]
     except Exception as e:
         session.rollback()
-        print(f"Error getting user {table} titles {e}")
-        return[]
+        print(f"Error getting top media: {e}")
+        return []
     finally:
         session.close()
 
@@ -164,6 +379,19 @@ def createPost(userid: int, mediaid: int, title: str, content: str, spoiler: boo
         session.flush()
 
         session.execute(Creates.insert().values(UserID = userid, PostID = post.PostID))
+
+        # fan the post out to the author's timeline and the timelines of their followers
+        query = text(
+            """
+            INSERT INTO "timeline" ("UserID", "PostID", "Date")
+            SELECT :user_id, :post_id, :date
+            UNION
+            SELECT "UserID", :post_id, :date FROM "follows" WHERE "FollowerID" = :user_id
+            ON CONFLICT DO NOTHING
+            """)
+        session.execute(query, {"user_id": userid, "post_id": post.PostID, "date": post.Date})
+
+        updateMediaStats(session, post.MediaID, post.Rating, 1)
         session.commit()
     except Exception as e:
         session.rollback()
@@ -191,62 +419,184 @@ def addComment(userid: int, postid: int, content: str) -> None:
         session.close()
 
 def deletePost(postid: int) -> None:
-    """Allow user to delete a post"""
+    """Allow user to delete a post; its comments, creates row and timeline entries go with it (ON DELETE CASCADE)"""
     session = get_session()
     try:
-        query = text(
-            """
-            DELETE FROM "makes"
-            WHERE "CommentID" IN (
-                SELECT "CommentID" FROM "comment" WHERE "PostID" =:post_id
-            )
-            """)
-        session.execute(query, {"post_id": postid})
-
-        query = text(
-            """
-            DELETE FROM "comment"
-            WHERE "PostID" = :post_id
-            """)
-        session.execute(query, {"post_id": postid})
-
-        query = text(
-            """
-            DELETE FROM "creates"
-            WHERE "PostID" = :post_id
-            """
-        )
-        session.execute(query, {"post_id": postid})
-        
         query = text(
             """
             DELETE FROM "post"
             WHERE "PostID" = :post_id
+            RETURNING "MediaID", "Rating"
             """)
-        session.execute(query, {"post_id": postid})
+        deleted = session.execute(query, {"post_id": postid}).first()
+        if deleted:
+            updateMediaStats(session, deleted.MediaID, deleted.Rating, -1)
         session.commit()
     except Exception as e:
         session.rollback()
         print("Error deleting post:", e)
     finally:
         session.close()
-    
+
+# rows deleted per transaction by deletePosts and purgeUser
+PURGE_BATCH_SIZE = 500
+
+def _removeFromMediaStats(session, deleted_posts: list) -> None:
+    """Take a batch of deleted posts (MediaID, Rating rows) out of the media_stats totals"""
+    removed = Counter((post.MediaID, post.Rating) for post in deleted_posts)
+    for (mediaid, rating), count in removed.items():
+        updateMediaStats(session, mediaid, rating, -count)
+
+def _deleteInBatches(query, params: dict, batch_size: int, on_deleted=None) -> int:
+    """ Run a DELETE that removes at most :batch_size rows until it removes fewer, committing every batch
+
+        Each batch is a short transaction of its own, even during a request, so locks are
+        only held for one batch and the batches already done stay done if a later one fails.
+
+        returns:
+            count (int): rows deleted
+    """
+    total = 0
+    while True:
+        session = PostgresSession()
+        try:
+            result = session.execute(query, {**params, "batch_size": batch_size})
+            count = result.rowcount
+            if on_deleted and result.returns_rows:
+                on_deleted(session, result.fetchall())
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        total += count
+        if count < batch_size:
+            return total
+
+DELETE_POSTS_QUERY = text(
+    """
+    DELETE FROM "post"
+    WHERE "PostID" IN (
+        SELECT "PostID" FROM "post" WHERE "PostID" = ANY(:post_ids) LIMIT :batch_size
+    )
+    RETURNING "MediaID", "Rating"
+    """)
+
+def deletePosts(post_ids: list, batch_size: int = PURGE_BATCH_SIZE) -> int:
+    """ Delete many posts, batch_size per transaction
+
+        returns:
+            count (int): posts deleted
+    """
+    try:
+        return _deleteInBatches(DELETE_POSTS_QUERY, {"post_ids": [int(postid) for postid in post_ids]},
+                                batch_size, _removeFromMediaStats)
+    except Exception as e:
+        print(f"Error deleting posts: {e}")
+        return 0
+
+# what purgeUser removes, in order. Timeline entries of the user's posts go before the
+# posts so one batch of posts doesn't cascade into every follower's timeline at once.
+PURGE_USER_STEPS = [
+    ("sessions", text('DELETE FROM "user_session" WHERE "UserID" = :user_id'), None),
+    ("timeline entries of posts", text(
+        """
+        DELETE FROM "timeline"
+        WHERE ("UserID", "PostID") IN (
+            SELECT T."UserID", T."PostID" FROM "creates" C
+            JOIN "timeline" T ON T."PostID" = C."PostID"
+            WHERE C."UserID" = :user_id
+            LIMIT :batch_size
+        )
+        """), None),
+    ("posts", text(
+        """
+        DELETE FROM "post"
+        WHERE "PostID" IN (
+            SELECT "PostID" FROM "creates" WHERE "UserID" = :user_id LIMIT :batch_size
+        )
+        RETURNING "MediaID", "Rating"
+        """), _removeFromMediaStats),
+    ("comments", text(
+        """
+        DELETE FROM "comment"
+        WHERE "CommentID" IN (
+            SELECT "CommentID" FROM "makes" WHERE "UserID" = :user_id LIMIT :batch_size
+        )
+        """), None),
+    ("following", text(
+        """
+        DELETE FROM "follows"
+        WHERE "UserID" = :user_id AND "FollowerID" IN (
+            SELECT "FollowerID" FROM "follows" WHERE "UserID" = :user_id LIMIT :batch_size
+        )
+        """), None),
+    ("followers", text(
+        """
+        DELETE FROM "follows"
+        WHERE "FollowerID" = :user_id AND "UserID" IN (
+            SELECT "UserID" FROM "follows" WHERE "FollowerID" = :user_id LIMIT :batch_size
+        )
+        """), None),
+    ("timeline", text(
+        """
+        DELETE FROM "timeline"
+        WHERE "UserID" = :user_id AND "PostID" IN (
+            SELECT "PostID" FROM "timeline" WHERE "UserID" = :user_id LIMIT :batch_size
+        )
+        """), None),
+] + [
+    (table, text(
+        f"""
+        DELETE FROM "{table}"
+        WHERE "UserID" = :user_id AND "MediaID" IN (
+            SELECT "MediaID" FROM "{table}" WHERE "UserID" = :user_id LIMIT :batch_size
+        )
+        """), None)
+    for table in WATCH_TABLES
+] + [
+    ("user", text('DELETE FROM "user" WHERE "UserID" = :user_id'), None),
+]
+
+def purgeUser(userid: int, batch_size: int = PURGE_BATCH_SIZE) -> dict:
+    """ Delete an account with its sessions, posts, comments, follows, timeline and list entries
+
+        Everything is deleted in batches of at most batch_size rows, one short transaction
+        each, so a large account never holds locks for long. The user row goes last;
+        if a step fails the purge stops and can simply be run again.
+
+        returns:
+            counts (dict): rows deleted per step, or None if the purge failed
+    """
+    counts = {}
+    try:
+        for name, query, on_deleted in PURGE_USER_STEPS:
+            counts[name] = _deleteInBatches(query, {"user_id": int(userid)}, batch_size, on_deleted)
+        return counts
+    except Exception as e:
+        print(f"Error purging user {userid}: {e}")
+        return None
+
+SUGGESTED_USERS_QUERY = text(
+    """
+    SELECT "UserID", "UName", "FName", "LName"
+    FROM "user"
+    WHERE "UserID" != :user_id
+    AND "UserID" NOT IN (
+        SELECT "FollowerID" FROM "follows" WHERE "UserID" = :user_id
+    )
+    ORDER BY "UName"
+    """)
+
 def get_all_users_except_current(user_id: int) -> list:
     """Get all users except the current user for follow suggestions"""
     session = get_session()
     try:
-        query = text("""
-        SELECT "UserID", "UName", "FName", "LName"
-        FROM "user"
-        WHERE "UserID" != :user_id
-        AND "UserID" NOT IN (
-            SELECT "FollowerID" FROM "follows" WHERE "UserID" = :user_id
-        )
-        ORDER BY "UName"
-        """)
-        result = session.execute(query, {"user_id": user_id})
+        result = session.execute(SUGGESTED_USERS_QUERY, {"user_id": user_id})
         return [dict(row) for row in result.mappings()]
     except Exception as e:
+        session.rollback()
         print("Error getting users:", e)
         return []
     finally:
@@ -256,25 +606,30 @@ def follow_user(user_id: int, follower_id: int) -> bool:
     """Follow another user"""
     session = get_session()
     try:
-        # Check if already following
-        check_query = text("""
-        SELECT 1 FROM "follows" 
-        WHERE "UserID" = :user_id AND "FollowerID" = :follower_id
-        """)
-        existing = session.execute(check_query, {
-            "user_id": user_id, 
-            "follower_id": follower_id
-        }).first()
-        
-        if existing:
-            return False  # Already following
-        
-        # Insert follow relationship
+        # Insert follow relationship; the primary key turns a repeat follow into a no-op
         insert_query = text("""
         INSERT INTO "follows" ("UserID", "FollowerID")
         VALUES (:user_id, :follower_id)
+        ON CONFLICT DO NOTHING
         """)
-        session.execute(insert_query, {
+        result = session.execute(insert_query, {
+            "user_id": user_id,
+            "follower_id": follower_id
+        })
+
+        if result.rowcount == 0:
+            return False  # Already following
+
+        # backfill the followed user's posts into the timeline
+        timeline_query = text("""
+        INSERT INTO "timeline" ("UserID", "PostID", "Date")
+        SELECT :user_id, P."PostID", P."Date"
+        FROM "creates" C
+        JOIN "post" P ON C."PostID" = P."PostID"
+        WHERE C."UserID" = :follower_id
+        ON CONFLICT DO NOTHING
+        """)
+        session.execute(timeline_query, {
             "user_id": user_id,
             "follower_id": follower_id
         })
@@ -299,6 +654,19 @@ def unfollow_user(user_id: int, follower_id: int) -> bool:
             "user_id": user_id,
             "follower_id": follower_id
         })
+
+        # drop the unfollowed user's posts from the timeline (a user's own posts always stay)
+        timeline_query = text("""
+        DELETE FROM "timeline" T
+        USING "creates" C
+        WHERE T."PostID" = C."PostID"
+        AND T."UserID" = :user_id AND C."UserID" = :follower_id
+        AND C."UserID" != T."UserID"
+        """)
+        session.execute(timeline_query, {
+            "user_id": user_id,
+            "follower_id": follower_id
+        })
         session.commit()
         return result.rowcount > 0
     except Exception as e:
@@ -308,60 +676,69 @@ def unfollow_user(user_id: int, follower_id: int) -> bool:
     finally:
         session.close()
 
+FOLLOWING_QUERY = text(
+    """
+    SELECT U."UserID", U."UName", U."FName", U."LName"
+    FROM "follows" F
+    JOIN "user" U ON F."FollowerID" = U."UserID"
+    WHERE F."UserID" = :user_id
+    ORDER BY U."UName"
+    """)
+
 def get_following(user_id: int) -> list:
     """Get users that the current user is following"""
     session = get_session()
     try:
-        query = text("""
-        SELECT U."UserID", U."UName", U."FName", U."LName"
-        FROM "follows" F
-        JOIN "user" U ON F."FollowerID" = U."UserID"
-        WHERE F."UserID" = :user_id
-        ORDER BY U."UName"
-        """)
-        result = session.execute(query, {"user_id": user_id})
+        result = session.execute(FOLLOWING_QUERY, {"user_id": user_id})
         return [dict(row) for row in result.mappings()]
     except Exception as e:
+        session.rollback()
         print("Error getting following list:", e)
         return []
     finally:
         session.close()
 
+FOLLOWERS_QUERY = text(
+    """
+    SELECT U."UserID", U."UName", U."FName", U."LName"
+    FROM "follows" F
+    JOIN "user" U ON F."UserID" = U."UserID"
+    WHERE F."FollowerID" = :user_id
+    ORDER BY U."UName"
+    """)
+
 def get_followers(user_id: int) -> list:
     """Get users who are following the current user"""
     session = get_session()
     try:
-        query = text("""
-        SELECT U."UserID", U."UName", U."FName", U."LName"
-        FROM "follows" F
-        JOIN "user" U ON F."UserID" = U."UserID"
-        WHERE F."FollowerID" = :user_id
-        ORDER BY U."UName"
-        """)
-        result = session.execute(query, {"user_id": user_id})
+        result = session.execute(FOLLOWERS_QUERY, {"user_id": user_id})
         return [dict(row) for row in result.mappings()]
     except Exception as e:
+        session.rollback()
         print("Error getting followers list:", e)
         return []
     finally:
         session.close()
 
-def is_following(user_id: int, target_user_id: int) -> bool:
-    """Check if user is following another user"""
+def get_following_ids(user_id: int, target_user_ids: list) -> set:
+    """Return which of target_user_ids the user follows, in one query"""
+    if not target_user_ids:
+        return set()
     session = get_session()
     try:
         query = text("""
-        SELECT 1 FROM "follows" 
-        WHERE "UserID" = :user_id AND "FollowerID" = :target_user_id
-        """)
+        SELECT "FollowerID" FROM "follows"
+        WHERE "UserID" = :user_id AND "FollowerID" IN :target_user_ids
+        """).bindparams(bindparam("target_user_ids", expanding=True))
         result = session.execute(query, {
             "user_id": user_id,
-            "target_user_id": target_user_id
-        }).first()
-        return result is not None
+            "target_user_ids": list(target_user_ids)
+        })
+        return {row[0] for row in result}
     except Exception as e:
+        session.rollback()
         print("Error checking follow status:", e)
-        return False
+        return set()
     finally:
         session.close()
 
@@ -385,78 +762,34 @@ def addToWatchTable(userid: int, mediaid: int, table: str ) -> None:
     finally:
         session.close()
 
-def removeFromWatchTable(userid: int, title: str, table: str) -> None:
+def removeFromWatchTable(userid: int, mediaid: int, table: str) -> None:
     """Remove a movie/show from the user's list"""
     session = get_session()
     try:
-        mediaid = session.execute(text('SELECT "MediaID" FROM "tvmovie" WHERE "Title" = :title'), {"title": title}).scalar()
-
-        if mediaid:
-            session.execute(text(f'DELETE FROM {table} WHERE "UserID" = :user_id AND "MediaID" = :media_id'), {"user_id": userid, "media_id": mediaid})
-            session.commit()
+        session.execute(text(f'DELETE FROM {table} WHERE "UserID" = :user_id AND "MediaID" = :media_id'), {"user_id": userid, "media_id": mediaid})
+        session.commit()
     except Exception as e:
         session.rollback()
         print(f"Error removing from {table}: {e}")
     finally:
         session.close()
 
-def search_users(search_term: str, current_user_id: int = None) -> list:
-    """Search for users by username, first name, or last name"""
-    session = get_session()
-    try:
-        from db.schema.user import User  
-        
-        search_pattern = f"%{search_term}%"
-        
-        query = session.query(User).filter(
-            or_(
-                User.UName.ilike(search_pattern),
-                User.FName.ilike(search_pattern),
-                User.LName.ilike(search_pattern)
-            )
-        )
-        
-        if current_user_id:
-            query = query.filter(User.UserID != current_user_id)
-        
-        #Limit results to 20
-        users = query.limit(20).all()
-        
-        return users
-    except Exception as e:
-        print(f"Error searching users: {e}")
-        return []
 def deleteComment(comment_id: int, user_id: int) -> bool:
-    """Delete a comment if the user owns it"""
+    """Delete a comment if the user owns it; its makes row goes with it (ON DELETE CASCADE)"""
     session = get_session()
     try:
-
-        check_query = text(
+        query = text(
         """
-        SELECT 1 FROM "makes" 
-        WHERE "CommentID" = :comment_id AND "UserID" = :user_id
+        DELETE FROM "comment"
+        WHERE "CommentID" = :comment_id AND EXISTS (
+            SELECT 1 FROM "makes"
+            WHERE "CommentID" = :comment_id AND "UserID" = :user_id
+        )
         """)
-        ownership = session.execute(check_query, {
+        result = session.execute(query, {
             "comment_id": comment_id,
             "user_id": user_id
-        }).first()
-
-        if not ownership:
-            return False
-
-        delete_makes_query = text(
-        """
-        DELETE FROM "makes" 
-        WHERE "CommentID" = :comment_id
-        """)
-        session.execute(delete_makes_query, {"comment_id": comment_id})
-
-        delete_comment_query = text(
-        """
-        DELETE FROM "comment" 
-        WHERE "CommentID" = :comment_id
-        """)
-        result = session.execute(delete_comment_query, {"comment_id": comment_id})
+        })
 
         session.commit()
         return result.rowcount > 0
@@ -468,20 +801,20 @@ def deleteComment(comment_id: int, user_id: int) -> bool:
     finally:
         session.close()
 
+CHECK_FOLLOWING_QUERY = text(
+    """
+    SELECT 1
+    FROM "follows"
+    WHERE "UserID" = :userid
+    AND "FollowerID" = :otheruserid
+    """)
+
 def checkFollowing(userid:int, otheruserid:int) -> bool:
     """Check if a user is following another user"""
     session = get_session()
 
     try:
-        query = text(
-            f"""
-            SELECT 1
-            FROM "follows"
-            WHERE "UserID" = :userid
-            AND "FollowerID" = :otheruserid
-            """
-        )
-        result = session.execute(query, {"userid": userid,"otheruserid": otheruserid}).first()
+        result = session.execute(CHECK_FOLLOWING_QUERY, {"userid": userid,"otheruserid": otheruserid}).first()
         return result is not None
     except Exception as e:
         session.rollback()
@@ -490,19 +823,19 @@ def checkFollowing(userid:int, otheruserid:int) -> bool:
     finally:
         session.close()
 
+MEDIA_INFO_QUERY = text(
+    """
+    SELECT "Title" AS media_title, "Genre" AS media_genre, "Year" AS media_year, "Type" AS media_type
+    FROM "tvmovie"
+    WHERE "MediaID" = :mediaid
+    """)
+
 def getMediaInfo(mediaid:int):
     """Get all information about a given media"""
     session = get_session()
     
     try:
-        query = text(
-            f"""
-            SELECT "Title" AS media_title, "Genre" AS media_genre, "Year" AS media_year, "Type" AS media_type
-            FROM "tvmovie"
-            WHERE "MediaID" = :mediaid
-            """
-        )
-        result = session.execute(query, {"mediaid": mediaid}).fetchone()
+        result = session.execute(MEDIA_INFO_QUERY, {"mediaid": mediaid}).fetchone()
         
         return result
     except Exception as e:
@@ -511,22 +844,46 @@ def getMediaInfo(mediaid:int):
     finally:
         session.close()
 
+MEDIA_VERSION_QUERY = text(
+    """
+    SELECT COALESCE((SELECT "Version" FROM "media_version" WHERE "MediaID" = :mediaid), 0) AS media_version,
+        (SELECT "Version" FROM "catalog_version" WHERE "ID" = 1) AS catalog_version
+    """)
+
+def getMediaVersion(mediaid: int):
+    """Return (media version, catalog version): together they change whenever the media page of mediaid does
+
+        The media version is bumped by triggers (migration 006) when createPost, deletePost,
+        addComment, deleteComment or a cascade adds or removes a post or comment of the title.
+        Returns None when the versions can't be read.
+    """
+    session = get_session()
+    try:
+        row = session.execute(MEDIA_VERSION_QUERY, {"mediaid": mediaid}).fetchone()
+        return (row.media_version, row.catalog_version)
+    except Exception as e:
+        session.rollback()
+        print(f"Error getting media version: {e}")
+        return None
+    finally:
+        session.close()
+
+MEDIA_POSTS_QUERY = text(
+    """
+    SELECT U."UserID" AS userid, U."UName" AS username, P."PostID" AS postid, P."Title" AS post_title, 
+        P."Date" AS post_date, P."Content" AS post_content, TV."Title" AS media_title, P."Spoiler" AS spoiler, P."Rating" AS rating
+    FROM "tvmovie" TV
+    JOIN "post" P ON TV."MediaID" = P."MediaID"
+    JOIN "creates" C ON P."PostID" = C."PostID"
+    JOIN "user" U ON C."UserID" = U."UserID"
+    WHERE TV."MediaID" = :mediaid
+    """)
+
 def getMediaPosts(mediaid:int) -> list:
     """Get all posts for a given media"""
     session = get_session()
     try:
-        query = text(
-            f"""
-            SELECT U."UserID" AS userid, U."UName" AS username, P."PostID" AS postid, P."Title" AS post_title, 
-                P."Date" AS post_date, P."Content" AS post_content, TV."Title" AS media_title, P."Spoiler" AS spoiler, P."Rating" AS rating
-            FROM "tvmovie" TV
-            JOIN "post" P ON TV."MediaID" = P."MediaID"
-            JOIN "creates" C ON P."PostID" = C."PostID"
-            JOIN "user" U ON C."UserID" = U."UserID"
-            WHERE TV."MediaID" = :mediaid
-            """
-        )
-        posts = session.execute(query, {"mediaid": mediaid}).mappings().all()
+        posts = session.execute(MEDIA_POSTS_QUERY, {"mediaid": mediaid}).mappings().all()
         return [dict(row) for row in posts]
     except Exception as e:
         session.rollback()
@@ -534,29 +891,58 @@ def getMediaPosts(mediaid:int) -> list:
     finally:
         session.close()
 
-def search_users(search_term: str, current_user_id: int = None) -> list:
-    """Search for users by username, first name, or last name"""
+def search_users(search_term: str, current_user_id: int = None, limit: int = 20, offset: int = 0) -> list:
+    """Search for users by username, first name, or last name
+
+        Exact matches come first, then prefix matches, then any other substring matches.
+        The substring filters are served by the trigram indexes from migration 004.
+
+        returns:
+            users (list[dict]): UserID, UName, FName and LName of at most limit users
+    """
+    term = search_term.strip().lower()
+    if not term:
+        return []
+    # match the term literally, not as a LIKE pattern
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
     session = get_session()
     try:
-        from db.schema.user import User  
-        
-        search_pattern = f"%{search_term}%"
-        
-        query = session.query(User).filter(
-            or_(
-                User.UName.ilike(search_pattern),
-                User.FName.ilike(search_pattern),
-                User.LName.ilike(search_pattern)
-            )
-        )
-        
+        exclude = ""
+        params = {
+            "term": term,
+            "prefix": escaped + "%",
+            "contains": "%" + escaped + "%",
+            "limit": limit,
+            "offset": offset
+        }
         if current_user_id:
-            query = query.filter(User.UserID != current_user_id)
-        
-        #Limit results to 20
-        users = query.limit(20).all()
-        
-        return users
+            exclude = 'AND "UserID" != :current_user_id'
+            params["current_user_id"] = current_user_id
+
+        query = text(
+            f"""
+            SELECT "UserID", "UName", "FName", "LName"
+            FROM "user"
+            WHERE (lower("UName") LIKE :contains
+                OR lower("FName") LIKE :contains
+                OR lower("LName") LIKE :contains)
+            {exclude}
+            ORDER BY
+                CASE
+                    WHEN lower("UName") = :term THEN 0
+                    WHEN lower("FName") = :term OR lower("LName") = :term THEN 1
+                    WHEN lower("UName") LIKE :prefix THEN 2
+                    WHEN lower("FName") LIKE :prefix OR lower("LName") LIKE :prefix THEN 3
+                    ELSE 4
+                END,
+                length("UName"), "UName"
+            LIMIT :limit OFFSET :offset
+            """)
+        return [dict(row) for row in session.execute(query, params).mappings()]
     except Exception as e:
+        session.rollback()
         print(f"Error searching users: {e}")
         return []
+    finally:
+        session.close()
@@ -2,10 +2,13 @@ from .comment import Comment
 from .creates import Creates
 from .follows import Follows
 from .makes import Makes
+from .mediastats import MediaStats
 from .post import Post
+from .timeline import Timeline
 from .tvmovie import TVMovie
 from .user import User
+from .usersession import UserSession
 from .watched import Watched
 from .watching import Watching
 from .watchlist import Watchlist
-__all__ = ['Comment', 'Creates', 'Follows', 'Makes', 'Post', 'TVMovie', 'User', 'Watched', 'Watching', 'Watchlist']
\ No newline at end of file
+__all__ = ['Comment', 'Creates', 'Follows', 'Makes', 'MediaStats', 'Post', 'Timeline', 'TVMovie', 'User', 'UserSession', 'Watched', 'Watching', 'Watchlist']
\ No newline at end of file
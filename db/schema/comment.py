@@ -1,5 +1,5 @@
 """comment.py: create a table named comment in the TV-SHOW-WEBAPP database"""
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from db.server import Base
 from db.schema.makes import Makes
@@ -7,11 +7,15 @@ from db.schema.makes import Makes
 class Comment(Base):
     __tablename__ = 'comment'
     CommentID = Column(Integer,primary_key=True,autoincrement=True)
-    PostID = Column(Integer,ForeignKey('post.PostID'))
+    PostID = Column(Integer,ForeignKey('post.PostID', ondelete='CASCADE'))
     # 40 = max length of string
     Date = Column(String(40))
     Content = Column(String(100))
 
+    __table_args__ = (
+        Index('ix_comment_post', 'PostID'),
+    )
+
     # create relationship with user table. assoc table name = makes
     User = relationship('User', secondary = Makes, back_populates = 'Comment')
     # create relationship with post table
@@ -1,5 +1,5 @@
 """creates.py: contains association tables for many to many relationships"""
-from sqlalchemy import Table, Column, Integer, ForeignKey
+from sqlalchemy import Table, Column, Integer, ForeignKey, Index
 from db.server import Base
 
 # join table between user and post
@@ -7,7 +7,9 @@ Creates = Table(
   'creates',
   Base.metadata,
   # grab the UserID primary key and make it a foreign key
-  Column('UserID', Integer, ForeignKey('user.UserID')),
+  Column('UserID', Integer, ForeignKey('user.UserID', ondelete='CASCADE'), primary_key=True),
   # grab the PostID primary key and make it a foreign key
-  Column('PostID', Integer, ForeignKey('post.PostID'))
-)
\ No newline at end of file
+  Column('PostID', Integer, ForeignKey('post.PostID', ondelete='CASCADE'), primary_key=True),
+  # reverse-direction lookups by PostID
+  Index('ix_creates_post', 'PostID')
+)
@@ -1,5 +1,5 @@
 """follows.py: contains association tables for many to many relationships"""
-from sqlalchemy import Table, Column, Integer, ForeignKey
+from sqlalchemy import Table, Column, Integer, ForeignKey, Index
 from db.server import Base
 
 # join table between user and comment
@@ -7,7 +7,9 @@ Follows = Table(
   'follows',
   Base.metadata,
   # grab the UserID primary key and make it a foreign key
-  Column('UserID', Integer, ForeignKey('user.UserID')),
+  Column('UserID', Integer, ForeignKey('user.UserID', ondelete='CASCADE'), primary_key=True),
   # grab the UserID primary key and make it a foreign key
-  Column('FollowerID', Integer, ForeignKey('user.UserID'))
-)
\ No newline at end of file
+  Column('FollowerID', Integer, ForeignKey('user.UserID', ondelete='CASCADE'), primary_key=True),
+  # reverse-direction lookups by FollowerID
+  Index('ix_follows_follower', 'FollowerID', 'UserID')
+)
@@ -1,12 +1,14 @@
 """makes.py: contains association tables for many to many relationships"""
-from sqlalchemy import Table, Column, Integer, ForeignKey
+from sqlalchemy import Table, Column, Integer, ForeignKey, Index
 from db.server import Base
 # join table between user and comment
 Makes = Table(
   'makes',
   Base.metadata,
   # grab the UserID primary key and make it a foreign key
-  Column('UserID', Integer, ForeignKey('user.UserID')),
+  Column('UserID', Integer, ForeignKey('user.UserID', ondelete='CASCADE'), primary_key=True),
   # grab the CommentID primary key and make it a foreign key
-  Column('CommentID', Integer, ForeignKey('comment.CommentID'))
-)
\ No newline at end of file
+  Column('CommentID', Integer, ForeignKey('comment.CommentID', ondelete='CASCADE'), primary_key=True),
+  # reverse-direction lookups by CommentID
+  Index('ix_makes_comment', 'CommentID')
+)
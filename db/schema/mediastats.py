@@ -0,0 +1,26 @@
+"""mediastats.py: create a table named media_stats in the TV-SHOW-WEBAPP database"""
+from sqlalchemy import Table, Column, Integer, Numeric, ForeignKey, Computed, Index
+from db.server import Base
+
+# running totals of the posts about each TV show/movie, kept up to date by
+# createPost and deletePost so pages never have to scan every post
+MediaStats = Table(
+  'media_stats',
+  Base.metadata,
+  # grab the MediaID primary key and make it a foreign key
+  Column('MediaID', Integer, ForeignKey('tvmovie.MediaID', ondelete='CASCADE'), primary_key=True),
+  Column('PostCount', Integer, nullable=False, default=0),
+  # posts that have a rating, and the sum of those ratings
+  Column('RatedCount', Integer, nullable=False, default=0),
+  Column('RatingSum', Integer, nullable=False, default=0),
+  # histogram of ratings: 1 = 480p, 2 = 720p, 3 = 1080p, 4 = 4K
+  Column('Rating1', Integer, nullable=False, default=0),
+  Column('Rating2', Integer, nullable=False, default=0),
+  Column('Rating3', Integer, nullable=False, default=0),
+  Column('Rating4', Integer, nullable=False, default=0),
+  Column('AvgRating', Numeric, Computed('"RatingSum"::numeric / NULLIF("RatedCount", 0)'))
+)
+
+# top rated / most reviewed listings read these indexes in order
+Index('ix_media_stats_top_rated', MediaStats.c.AvgRating.desc().nulls_last(), MediaStats.c.PostCount.desc())
+Index('ix_media_stats_most_reviewed', MediaStats.c.PostCount.desc())
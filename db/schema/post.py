@@ -1,5 +1,5 @@
 """post.py: create a table named post in the TV-SHOW-WEBAPP database"""
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from db.server import Base
 from db.schema.creates import Creates
@@ -16,6 +16,10 @@ class Post(Base):
     Spoiler = Column(Boolean)
     Rating = Column(Integer)
 
+    __table_args__ = (
+        Index('ix_post_media', 'MediaID'),
+    )
+
     # create relationship with user table. assoc table name = Creates
     User = relationship('User', secondary = Creates, back_populates = 'Post')
     # create relationship with comment table
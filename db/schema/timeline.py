@@ -0,0 +1,17 @@
+"""timeline.py: contains the precomputed home timeline of every user"""
+from sqlalchemy import Table, Column, Integer, String, ForeignKey, Index
+from db.server import Base
+
+# one row per post in a user's feed, written when posts and follows change
+Timeline = Table(
+  'timeline',
+  Base.metadata,
+  # grab the UserID primary key of the user whose feed this is
+  Column('UserID', Integer, ForeignKey('user.UserID', ondelete='CASCADE'), primary_key=True),
+  # grab the PostID primary key of the post shown in the feed
+  Column('PostID', Integer, ForeignKey('post.PostID', ondelete='CASCADE'), primary_key=True),
+  # copy of the post date so a feed page is a range scan on one index
+  Column('Date', String(40)),
+  Index('ix_timeline_user_date', 'UserID', 'Date', 'PostID'),
+  Index('ix_timeline_post', 'PostID')
+)
@@ -1,5 +1,5 @@
 """tvmovie.py: create a table named tvmovie in the TV-SHOW-WEBAPP database"""
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from db.server import Base
 from db.schema.watching import Watching
@@ -15,6 +15,10 @@ class TVMovie(Base):
     Year = Column(String(40))
     Type = Column(String(40))
 
+    __table_args__ = (
+        Index('ix_tvmovie_title', 'Title'),
+    )
+
     # create relationship with user table. assoc table name = Watching
     watchingUser = relationship('User', secondary = Watching, back_populates = 'TVMovieWatching')
     # create relationship with user table. assoc table name = Watched
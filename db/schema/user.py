@@ -1,5 +1,5 @@
 """user.py: create a table named user in the TV-SHOW-WEBAPP database"""
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from db.server import Base
 from db.schema.follows import Follows
@@ -19,6 +19,12 @@ class User(Base):
     PWord = Column(String(100))
     Email = Column(String(40))
 
+    # login looks users up by email; emails and user names must be unique
+    __table_args__ = (
+        Index('ux_user_email', 'Email', unique=True),
+        Index('ux_user_uname', 'UName', unique=True),
+    )
+
     # create relationship with post table. assoc table name = Creates
     Post = relationship('Post', secondary = Creates, back_populates = 'User')
     # create relationship with comment table. assoc table name = Makes
@@ -0,0 +1,23 @@
+"""usersession.py: create a table named user_session in the TV-SHOW-WEBAPP database"""
+from sqlalchemy import Table, Column, Integer, String, DateTime, ForeignKey, Index
+from db.server import Base
+
+# logged in users shared by every worker process (see session_store.py)
+UserSession = Table(
+  'user_session',
+  Base.metadata,
+  # sha256 of the token stored in the user's cookie
+  Column('TokenHash', String(64), primary_key=True),
+  # grab the UserID primary key and make it a foreign key
+  Column('UserID', Integer, ForeignKey('user.UserID', ondelete='CASCADE'), nullable=False),
+  # slim copy of the user record, never the password hash
+  Column('UName', String(40)),
+  Column('FName', String(40)),
+  Column('LName', String(40)),
+  Column('Email', String(40)),
+  Column('Expires', DateTime, nullable=False),
+  # expired sessions are purged by range
+  Index('ix_user_session_expires', 'Expires'),
+  # and a deleted user's sessions by UserID
+  Index('ix_user_session_user', 'UserID')
+)
@@ -1,5 +1,5 @@
 """watchlist.py: contains association tables for many to many relationships"""
-from sqlalchemy import Table, Column, Integer, ForeignKey
+from sqlalchemy import Table, Column, Integer, ForeignKey, Index
 from db.server import Base
 
 # join table between user and tvmovie
@@ -7,6 +7,9 @@ Watchlist = Table(
   'watchlist',
   Base.metadata,
   # grab the UserID primary key and make it a foreign key
-  Column('UserID', Integer, ForeignKey('user.UserID')),
+  Column('UserID', Integer, ForeignKey('user.UserID', ondelete='CASCADE'), primary_key=True),
   # grab the MediaID primary key and make it a foreign key
-  Column('MediaID', Integer, ForeignKey('tvmovie.MediaID')))
\ No newline at end of file
+  Column('MediaID', Integer, ForeignKey('tvmovie.MediaID', ondelete='CASCADE'), primary_key=True),
+  # reverse-direction lookups by MediaID
+  Index('ix_watchlist_media', 'MediaID')
+)
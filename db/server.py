@@ -1,13 +1,19 @@
 """server.py: connect to Postgre database and create tables"""
+import logging
 import os
+from time import perf_counter
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from flask import g, has_request_context
+from db.pool import TimedQueuePool
 
 # Load environment variables from .env
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 Base = declarative_base()
 
 # database values
@@ -20,7 +26,60 @@ db_owner = os.getenv('db_owner')
 db_pass = os.getenv('db_pass')
 db_url = f"postgresql://{db_owner}:{db_pass}@{db_host}:{db_port}/{db_name}"
 
-engine = create_engine(db_url)
+# connection pool, per process
+# connections kept open
+db_pool_size = int(os.getenv('db_pool_size', '5'))
+# extra connections opened under load and closed when returned
+db_max_overflow = int(os.getenv('db_max_overflow', '10'))
+# connections opened when a worker starts, so its first requests don't wait to connect
+db_pool_min = min(int(os.getenv('db_pool_min', '2')), db_pool_size)
+# connections in the asyncpg pool of db/async_query.py, on top of the ones above
+db_async_pool_size = int(os.getenv('db_async_pool_size', '3'))
+# seconds to wait for a free connection before giving up
+db_pool_timeout = float(os.getenv('db_pool_timeout', '30'))
+# seconds before a connection is replaced, so none outlive server-side timeouts
+db_pool_recycle = int(os.getenv('db_pool_recycle', '1800'))
+# test connections on checkout so a database restart doesn't surface as errors
+db_pool_pre_ping = os.getenv('db_pool_pre_ping', 'true').lower() in ('1', 'true', 'yes')
+
+engine = create_engine(
+    db_url,
+    poolclass=TimedQueuePool,
+    pool_size=db_pool_size,
+    max_overflow=db_max_overflow,
+    pool_timeout=db_pool_timeout,
+    pool_recycle=db_pool_recycle,
+    pool_pre_ping=db_pool_pre_ping
+)
+
+def record_statements(count: int, seconds: float, statement: str = None) -> None:
+    """Add statements and the time spent on them to the current request's totals
+
+    Read by metrics.py; the statement text goes to query_audit.py when it is watching.
+    """
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + count
+        g.sql_seconds = g.get('sql_seconds', 0.0) + seconds
+        log = g.get('sql_statement_log')
+        if log is not None and statement:
+            log[statement] += count
+
+@event.listens_for(engine, "before_cursor_execute")
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['statement_start'] = perf_counter()
+
+# statements that change nothing; anything else counts as a write
+READ_ONLY_STATEMENTS = ('SELECT', 'SHOW', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+@event.listens_for(engine, "begin")
+def _reset_writes(conn):
+    conn.info['wrote'] = False
+
+@event.listens_for(engine, "after_cursor_execute")
+def _stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    record_statements(1, perf_counter() - conn.info.pop('statement_start', perf_counter()), statement)
+    if not statement.lstrip().upper().startswith(READ_ONLY_STATEMENTS):
+        conn.info['wrote'] = True
 
 PostgresSession = sessionmaker(
     autocommit=False,
@@ -28,10 +87,124 @@ PostgresSession = sessionmaker(
     bind=engine
 )
 
+class RequestSessionFailed(Exception):
+    """A query function rolled back the request's session after the request had written to it"""
+
+class RequestSession(Session):
+    """Session shared by every query made during one Flask request
+
+    The query functions call commit() and close() as if they owned the session;
+    here commit() only flushes and close() does nothing. The request's work is
+    committed once, before the response is sent. A rollback() from a query
+    function throws away everything the request wrote before it, so a rollback
+    after a write marks the session failed: the request's later writes are
+    rolled back as well and the response becomes a 500.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failed = False
+        # the connection of the current transaction, kept because a failed flush
+        # leaves connection() raising until the rollback
+        self._transaction_connection = None
+
+    def commit(self):
+        self.flush()
+
+    def close(self):
+        pass
+
+    def _wrote(self) -> bool:
+        """Whether a statement other than a read ran to completion in the current transaction
+
+        A statement that failed, e.g. an INSERT hitting a unique key, changed nothing
+        and does not count.
+        """
+        if not self.in_transaction() or self._transaction_connection is None:
+            return False
+        return self._transaction_connection.info.get('wrote', False)
+
+    def rollback(self):
+        if self._wrote():
+            self.failed = True
+        super().rollback()
+
+    def finish(self, commit: bool) -> None:
+        """End the request's transaction and return the connection to the pool
+
+        Raises RequestSessionFailed, after rolling back, when commit is asked of a failed session.
+        """
+        try:
+            if commit and self.failed:
+                super().rollback()
+                raise RequestSessionFailed("a query failed after the request had written; its writes were rolled back")
+            if commit:
+                super().commit()
+            else:
+                super().rollback()
+        finally:
+            super().close()
+
+@event.listens_for(RequestSession, "after_begin")
+def _remember_connection(session, transaction, connection):
+    session._transaction_connection = connection
+
+RequestPostgresSession = sessionmaker(
+    class_=RequestSession,
+    autocommit=False,
+    autoflush=False,
+    bind=engine
+)
+
 def get_session():
-    """Get database session"""
+    """Get database session
+
+    Inside a Flask request every call returns the same session, opened on first use.
+    Outside one (scripts such as dummydata.py) each call gets a session of its own.
+    """
+    if has_request_context():
+        if 'db_session' not in g:
+            g.db_session = RequestPostgresSession()
+        return g.db_session
     return PostgresSession()
 
+def close_request_session() -> None:
+    """Commit the request's session now; raises if the request's writes could not be committed
+
+    Routes that go on to work on connections of their own (e.g. purgeUser) call
+    this first so the request holds no locks while they run.
+    """
+    session = g.pop('db_session', None)
+    if session is None:
+        return
+    session.finish(commit=True)
+
+def commit_request_session(response):
+    """after_request: commit the request's work before the response is sent
+
+    A failed commit raises, so the client gets a 500 instead of a page claiming
+    the write succeeded. Server errors roll back instead.
+    """
+    if response.status_code >= 500:
+        rollback_request_session()
+        return response
+    try:
+        close_request_session()
+    except Exception as e:
+        logger.error("Error committing request session: %s", e)
+        raise
+    return response
+
+def rollback_request_session(exception=None) -> None:
+    """teardown_request: roll back whatever the request left uncommitted (it raised, or never got a response)"""
+    session = g.pop('db_session', None)
+    if session is None:
+        return
+    try:
+        session.finish(commit=False)
+    except Exception as e:
+        logger.error("Error rolling back request session: %s", e)
+
 def init_database():
     """Initialize database tables"""
     try:
@@ -46,9 +219,23 @@ def init_database():
         from db.schema.watched import Watched
         from db.schema.watching import Watching
         from db.schema.watchlist import Watchlist
+        from db.schema.timeline import Timeline
+        from db.schema.usersession import UserSession
+        from db.schema.mediastats import MediaStats
+
+        # an existing database gets its timelines built the first time the table is created
+        backfill_timeline = not inspect(engine).has_table('timeline')
 
         # Create all of the tables
         Base.metadata.create_all(bind=engine)
+
+        # Bring tables that already existed up to the current schema
+        from db.migrate import apply_migrations
+        apply_migrations()
+
+        if backfill_timeline:
+            from db.query import rebuildTimeline
+            rebuildTimeline()
         print(f"\n\n----------- Connection successful!")
         print(f" * Connected to {db_name}")
         print(f" * Successfully created DB tables!")
@@ -1,7 +1,8 @@
 """dummydata.py: populate all tables in TV-SHOW-WEBAPP database respecting feed visibility"""
 
-import bcrypt
+from passwords import hash_passwords
 from db.server import get_session
+from db.query import rebuildTimeline
 from db.schema.user import User
 from db.schema.post import Post
 from db.schema.comment import Comment
@@ -14,20 +15,17 @@ from db.schema.watching import Watching
 from db.schema.watchlist import Watchlist
 
 
-def hash_password(password: str) -> str:
-    """Hashes the password"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-
 def create_dummy_data():
     session = get_session()
     try:
+        # hashed in parallel on the password hashing threads
+        passwords = hash_passwords(["pass123", "secret", "charlie123", "wonder", "evepass"])
         users = [
-            User(FName="Alice", LName="Smith", UName="alice123", PWord=hash_password("pass123"), Email="alice@example.com"),
-            User(FName="Bob", LName="Jones", UName="bobby", PWord=hash_password("secret"), Email="bob@example.com"),
-            User(FName="Charlie", LName="Brown", UName="charlieB", PWord=hash_password("charlie123"), Email="charlie@example.com"),
-            User(FName="Diana", LName="Prince", UName="dianaP", PWord=hash_password("wonder"), Email="diana@example.com"),
-            User(FName="Eve", LName="Adams", UName="eveA", PWord=hash_password("evepass"), Email="eve@example.com")
+            User(FName="Alice", LName="Smith", UName="alice123", PWord=passwords[0], Email="alice@example.com"),
+            User(FName="Bob", LName="Jones", UName="bobby", PWord=passwords[1], Email="bob@example.com"),
+            User(FName="Charlie", LName="Brown", UName="charlieB", PWord=passwords[2], Email="charlie@example.com"),
+            User(FName="Diana", LName="Prince", UName="dianaP", PWord=passwords[3], Email="diana@example.com"),
+            User(FName="Eve", LName="Adams", UName="eveA", PWord=passwords[4], Email="eve@example.com")
         ]
         session.add_all(users)
         session.flush()
@@ -115,9 +113,13 @@ def create_dummy_data():
             {"UserID": users[3].UserID, "MediaID": shows[4].MediaID},
             {"UserID": users[4].UserID, "MediaID": shows[3].MediaID},
         ]
+        session.execute(Watched.insert(), watched_data)
         session.commit()
         print("Successfully inserted dummy data with hashed passwords!")
 
+        # the bulk inserts above bypass createPost/follow_user, so build the feeds from scratch
+        rebuildTimeline()
+
     except Exception as e:
         session.rollback()
         print(f"Error inserting dummy data: {e}")
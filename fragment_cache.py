@@ -0,0 +1,131 @@
+"""fragment_cache.py: rendered HTML fragments kept in memory, keyed by the version of their data
+
+The header and post cards of a media page look the same to every viewer, so each
+worker renders them once per version of the title (db.query.getMediaVersion) and
+serves them from memory after that. The versions live in the database and are
+bumped by triggers whenever a post or comment of the title is added or removed
+(migration 006), so a write made through any worker or script invalidates every
+copy: the next request asks for the new version, misses and renders it, and the
+old version is dropped when the new one is stored. The cache is bounded by the
+size of the HTML it holds (fragment_cache_bytes), least recently used out first.
+
+The few parts that depend on the viewer, such as the delete buttons on their own
+posts and comments, are rendered into the fragment for everyone inside
+{% call owner_only(post.userid) %}...{% endcall %}. The fragment is split at
+those blocks when it is cached, and personalize() joins it back together for each
+viewer with only their own blocks.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from markupsafe import Markup
+
+# Load environment variables from .env
+load_dotenv()
+
+# characters of rendered HTML kept per worker process, about as many bytes
+fragment_cache_bytes = int(os.getenv('fragment_cache_bytes', str(64 * 1024 * 1024)))
+
+# user content is escaped by the templates, so only owner_only can produce these comments
+OWNER_BLOCK = re.compile(r'<!--owner:(\d+)-->(.*?)<!--/owner-->', re.S)
+
+
+def fragment_size(fragment) -> int:
+    """Characters of text in a fragment: a string, or tuples of strings (and owner ids)"""
+    if isinstance(fragment, str):
+        return len(fragment)
+    if isinstance(fragment, tuple):
+        return sum(fragment_size(part) for part in fragment)
+    return 0
+
+
+class FragmentCache:
+    """Rendered fragments by key, at most max_bytes of them, the least recently used evicted first
+
+    Keys are (kind, id, *version), e.g. ("media_page", 42, 7, 3). Storing a new
+    version of a kind and id drops the older one straight away: nothing asks for
+    it again, and a busy page would otherwise leave a full copy per write.
+    """
+
+    def __init__(self, max_bytes: int = fragment_cache_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        # key -> (fragment, size)
+        self._fragments = OrderedDict()
+        # (kind, id) -> the key of its cached version
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the fragment stored under key, or None"""
+        with self._lock:
+            entry = self._fragments.get(key)
+            if entry is None:
+                return None
+            self._fragments.move_to_end(key)
+            return entry[0]
+
+    def _remove(self, key) -> None:
+        _, size = self._fragments.pop(key)
+        self.size -= size
+        if self._versions.get(key[:2]) == key:
+            del self._versions[key[:2]]
+
+    def set(self, key, fragment) -> None:
+        """Store fragment under key, replacing any other version of the same kind and id"""
+        size = fragment_size(fragment)
+        # one page bigger than the whole cache would only evict everything else
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            for old in (key, self._versions.get(key[:2])):
+                if old in self._fragments:
+                    self._remove(old)
+            self._fragments[key] = (fragment, size)
+            self._versions[key[:2]] = key
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._fragments)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._fragments.clear()
+            self._versions.clear()
+            self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+
+def owner_only(owner: int, caller) -> Markup:
+    """Template call block shown only to the user owner: {% call owner_only(post.userid) %}...{% endcall %}"""
+    return Markup(f'<!--owner:{int(owner)}-->') + caller() + Markup('<!--/owner-->')
+
+
+def split_owner_blocks(fragment: str) -> tuple:
+    """Split a rendered fragment once, when it is cached, into (text, owner, block, text, owner, block, ..., text)"""
+    parts = OWNER_BLOCK.split(fragment)
+    for i in range(1, len(parts), 3):
+        parts[i] = int(parts[i])
+    return tuple(parts)
+
+
+def personalize(parts: tuple, userid: int) -> Markup:
+    """A fragment as userid sees it: their owner_only blocks kept, everyone else's removed"""
+    kept = [parts[0]]
+    for i in range(1, len(parts), 3):
+        if parts[i] == userid:
+            kept.append(parts[i + 1])
+        kept.append(parts[i + 2])
+    return Markup("".join(kept))
+
+
+def init_fragment_cache(app) -> None:
+    """Make owner_only available to templates"""
+    app.jinja_env.globals.update(owner_only=owner_only)
+
+
+# shared by every request in this process
+fragments = FragmentCache()
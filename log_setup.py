@@ -0,0 +1,172 @@
+"""log_setup.py: queue-based logging with per-route levels
+
+Request threads only put log records on a queue; a background listener thread
+formats them and writes them to logs/log.txt, so disk I/O never sits on the
+request path.
+
+Every worker process appends to the same file, so none of them rotates it: one
+process renaming the file while the others still write would lose lines or send
+them to an old file. Rotate it from outside with logrotate (see
+docs/installation.rst); WatchedFileHandler notices the file was moved and
+reopens logs/log.txt.
+
+Busy routes can be quietened per Flask endpoint:
+    log_route_levels=my_feed=WARNING,index=WARNING   drop records below that level
+    log_route_sample=my_feed=0.1,media_page=0.25     keep that fraction of INFO and below
+Warnings and errors are never sampled away.
+
+tail_log() gives the error pages the end of the log without reading the whole file.
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+from time import monotonic
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+from dotenv import load_dotenv
+from flask import has_request_context, request
+
+# Load environment variables from .env
+load_dotenv()
+
+LOG_FILE = os.path.join("logs", "log.txt")
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+log_level = os.getenv('log_level', 'INFO').upper()
+# error pages show the end of the log: read at most this many bytes of it...
+log_tail_max_bytes = int(os.getenv('log_tail_max_bytes', '65536'))
+# ...and reuse what was read for this many seconds
+log_tail_cache_seconds = float(os.getenv('log_tail_cache_seconds', '2'))
+
+_listener = None
+
+
+def parse_route_setting(value: str, convert) -> dict:
+    """"endpoint=value,endpoint=value" -> {endpoint: convert(value)}"""
+    settings = {}
+    for item in value.split(','):
+        endpoint, _, setting = item.partition('=')
+        if endpoint.strip() and setting.strip():
+            settings[endpoint.strip()] = convert(setting.strip())
+    return settings
+
+
+class RouteFilter(logging.Filter):
+    """Apply the per-route minimum level and sampling rate to records logged during a request"""
+
+    def __init__(self, levels: dict, sample: dict):
+        super().__init__()
+        self.levels = levels
+        self.sample = sample
+
+    def filter(self, record) -> bool:
+        if not (self.levels or self.sample) or not has_request_context():
+            return True
+        endpoint = request.endpoint
+        if record.levelno < self.levels.get(endpoint, logging.NOTSET):
+            return False
+        rate = self.sample.get(endpoint)
+        if rate is not None and record.levelno <= logging.INFO:
+            return random.random() < rate
+        return True
+
+
+# values that read the same whenever and from whichever thread they are formatted
+PRIMITIVE_TYPES = (str, bytes, int, float, type(None))
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread when that is safe
+
+    The stock handler formats every record before queueing it so it can be
+    pickled; this queue never leaves the process, so a record whose arguments
+    are all primitives goes as is. Anything else (a list that may change, an ORM
+    object that would load attributes from another thread) is merged into the
+    message here, as the stock handler does.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if args:
+            values = args.values() if isinstance(args, dict) else args
+            if not all(isinstance(value, PRIMITIVE_TYPES) for value in values):
+                record.msg = record.getMessage()
+                record.args = None
+        return record
+
+
+def configure_logging() -> QueueListener:
+    """Route the root logger through a queue to logs/log.txt and start the listener (once per process)"""
+    global _listener
+    if _listener is not None:
+        return _listener
+    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+    file_handler = WatchedFileHandler(LOG_FILE)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RouteFilter(
+        parse_route_setting(os.getenv('log_route_levels', ''), logging.getLevelName),
+        parse_route_setting(os.getenv('log_route_sample', ''), float)))
+
+    root = logging.getLogger()
+    root.setLevel(log_level)
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    # write out whatever is still queued when the process exits
+    atexit.register(_listener.stop)
+    return _listener
+
+
+TAIL_BLOCK_SIZE = 8192
+
+# (path, max_lines) -> (time read, tail)
+_tail_cache = {}
+_tail_lock = threading.Lock()
+
+
+def read_tail(path: str, max_lines: int, max_bytes: int = log_tail_max_bytes):
+    """Return the last max_lines lines of a file, reading backwards in blocks and never more than max_bytes"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        blocks = []
+        read = 0
+        newlines = 0
+        # one extra newline so the first kept line is complete
+        while position > 0 and read < max_bytes and newlines <= max_lines:
+            size = min(TAIL_BLOCK_SIZE, position, max_bytes - read)
+            position -= size
+            f.seek(position)
+            block = f.read(size)
+            blocks.append(block)
+            read += size
+            newlines += block.count(b'\n')
+    data = b''.join(reversed(blocks))
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    # drop a line cut in half by the byte cap or block boundary
+    if position > 0 and lines:
+        lines = lines[1:]
+    return "\n".join(lines[-max_lines:])
+
+
+def tail_log(path: str = LOG_FILE, max_lines: int = 80):
+    """The last max_lines lines of the log, cached for log_tail_cache_seconds; None if unreadable"""
+    key = (path, max_lines)
+    now = monotonic()
+    with _tail_lock:
+        cached = _tail_cache.get(key)
+        if cached and now - cached[0] < log_tail_cache_seconds:
+            return cached[1]
+    try:
+        tail = read_tail(path, max_lines)
+    except Exception:
+        return None
+    with _tail_lock:
+        _tail_cache[key] = (now, tail)
+    return tail
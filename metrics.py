@@ -0,0 +1,168 @@
+"""metrics.py: per-route request and SQL metrics in Prometheus text format
+
+init_metrics(app) times every request and records, per Flask endpoint, a latency
+histogram, a count per status code, and the SQL statements run and the time spent
+waiting on them (counted by the engine hooks in db/server.py). GET /metrics
+exposes them together with the connection pool counters from db/pool.py.
+
+With server_timing=true every response also carries a Server-Timing header, e.g.
+    Server-Timing: app;dur=41.2, db;dur=33.0;desc="12 statements"
+which browsers' developer tools show next to the request.
+
+The numbers are per worker process; Prometheus scrapes each worker.
+
+/metrics and /pool_status describe the app's internals, so they answer only
+requests from the addresses in metrics_allowed_addresses or carrying
+Authorization: Bearer <metrics_token>; with neither set they answer no one.
+"""
+import hmac
+import os
+import threading
+from collections import defaultdict
+from time import perf_counter
+from dotenv import load_dotenv
+from flask import g, request, Response
+from db.server import engine
+from db.pool import pool_metrics
+
+# Load environment variables from .env
+load_dotenv()
+
+server_timing = os.getenv('server_timing', 'false').lower() in ('1', 'true', 'yes')
+# e.g. 127.0.0.1 for a scraper on the same host; not behind a reverse proxy on it, which every request comes from
+metrics_allowed_addresses = {address.strip() for address in os.getenv('metrics_allowed_addresses', '').split(',')
+                             if address.strip()}
+metrics_token = os.getenv('metrics_token') or None
+
+# upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RouteMetrics:
+    """Request, latency and SQL totals per endpoint, shared by every thread in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Zero every total"""
+        with self._lock:
+            # (endpoint, method, status) -> requests
+            self.requests = defaultdict(int)
+            # endpoint -> [count per bucket..., +Inf count], sum of seconds
+            self.latency_buckets = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+            self.latency_sum = defaultdict(float)
+            self.sql_statements = defaultdict(int)
+            self.sql_seconds = defaultdict(float)
+
+    def observe(self, endpoint: str, method: str, status: int, seconds: float, statements: int, sql_seconds: float) -> None:
+        """Record one finished request"""
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            buckets = self.latency_buckets[endpoint]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            self.latency_sum[endpoint] += seconds
+            self.sql_statements[endpoint] += statements
+            self.sql_seconds[endpoint] += sql_seconds
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append("# HELP http_requests_total Requests handled, by endpoint, method and status")
+            lines.append("# TYPE http_requests_total counter")
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+            lines.append("# HELP http_request_duration_seconds Request latency, by endpoint")
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for endpoint in sorted(self.latency_buckets):
+                buckets = self.latency_buckets[endpoint]
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {self.latency_sum[endpoint]:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{endpoint="{endpoint}"}} {cumulative}')
+
+            lines.append("# HELP db_statements_total SQL statements run, by endpoint")
+            lines.append("# TYPE db_statements_total counter")
+            for endpoint, count in sorted(self.sql_statements.items()):
+                lines.append(f'db_statements_total{{endpoint="{endpoint}"}} {count}')
+
+            lines.append("# HELP db_statement_seconds_total Time requests spent waiting on SQL, by endpoint")
+            lines.append("# TYPE db_statement_seconds_total counter")
+            for endpoint, seconds in sorted(self.sql_seconds.items()):
+                lines.append(f'db_statement_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+
+        pool = engine.pool
+        lines += [
+            "# HELP db_pool_checked_out Connections in use",
+            "# TYPE db_pool_checked_out gauge",
+            f"db_pool_checked_out {pool.checkedout()}",
+            "# HELP db_pool_size Connections the pool keeps open",
+            "# TYPE db_pool_size gauge",
+            f"db_pool_size {pool.size()}",
+            "# HELP db_pool_checkouts_total Connections handed out",
+            "# TYPE db_pool_checkouts_total counter",
+            f"db_pool_checkouts_total {pool_metrics.checkouts}",
+            "# HELP db_pool_checkout_failures_total Checkouts that timed out waiting for a connection",
+            "# TYPE db_pool_checkout_failures_total counter",
+            f"db_pool_checkout_failures_total {pool_metrics.failures}",
+            "# HELP db_pool_checkout_wait_seconds_total Time spent waiting for connections",
+            "# TYPE db_pool_checkout_wait_seconds_total counter",
+            f"db_pool_checkout_wait_seconds_total {pool_metrics.wait_total:.6f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+# shared by every request in this process
+route_metrics = RouteMetrics()
+
+
+def metrics_allowed() -> bool:
+    """Whether the current request may read /metrics and /pool_status"""
+    if request.remote_addr in metrics_allowed_addresses:
+        return True
+    if metrics_token is None:
+        return False
+    return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {metrics_token}".encode())
+
+
+def init_metrics(app) -> None:
+    """Time every request of app and add the /metrics endpoint"""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = perf_counter()
+        # g can outlive one request (e.g. an app context pushed around several test requests)
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        seconds = perf_counter() - start
+        statements = g.get('sql_statements', 0)
+        sql_seconds = g.get('sql_seconds', 0.0)
+        route_metrics.observe(request.endpoint or "unmatched", request.method, response.status_code,
+                              seconds, statements, sql_seconds)
+        if server_timing:
+            response.headers['Server-Timing'] = (f'app;dur={seconds * 1000:.1f}, '
+                                                 f'db;dur={sql_seconds * 1000:.1f};desc="{statements} statements"')
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Request, SQL and connection pool metrics for this worker, in Prometheus text format"""
+        if not metrics_allowed():
+            return Response('Forbidden', status=403, mimetype='text/plain')
+        return Response(route_metrics.render(), mimetype='text/plain; version=0.0.4')
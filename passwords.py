@@ -0,0 +1,101 @@
+"""passwords.py: hash and check passwords on a bounded pool of worker threads
+
+A bcrypt hash takes a few hundred milliseconds of CPU on purpose. Running it on the
+request thread lets a burst of logins starve every other route, so hashes run on
+password_workers threads instead, and at most password_queue_size more wait for
+one. When that is full, callers wait up to password_queue_timeout seconds and then
+get PasswordHasherBusy, which the routes turn into a "try again" page.
+
+The bcrypt cost comes from bcrypt_rounds. Hashes made with a different cost are
+rehashed the next time their owner logs in (see check_password).
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from dotenv import load_dotenv
+
+# Load environment variables from .env
+load_dotenv()
+
+# bcrypt work factor; each step doubles the time per hash
+bcrypt_rounds = int(os.getenv('bcrypt_rounds', '12'))
+# threads hashing at the same time (bcrypt releases the GIL while it works)
+password_workers = int(os.getenv('password_workers', str(os.cpu_count() or 2)))
+# hashes allowed to wait for a free thread before new ones are turned away
+password_queue_size = int(os.getenv('password_queue_size', str(password_workers * 4)))
+# seconds a request waits for room in the queue
+password_queue_timeout = float(os.getenv('password_queue_timeout', '2'))
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when every hashing thread is busy and the queue is full"""
+
+
+_executor = ThreadPoolExecutor(max_workers=password_workers, thread_name_prefix="bcrypt")
+# one slot per running or waiting hash
+_slots = threading.BoundedSemaphore(password_workers + password_queue_size)
+
+
+def _run(function, *args, timeout: float = password_queue_timeout):
+    """Run function on the hashing pool and wait for its result"""
+    if not _slots.acquire(timeout=timeout):
+        raise PasswordHasherBusy("Too many password checks in progress")
+    try:
+        future = _executor.submit(function, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_rounds(hashed: str) -> int:
+    """The cost a bcrypt hash was made with ("$2b$12$..." -> 12)"""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True if the hash was made with a cost other than bcrypt_rounds"""
+    return hash_rounds(hashed) != bcrypt_rounds
+
+
+def hash_password(password: str) -> str:
+    """Hash a password with bcrypt_rounds"""
+    return _run(_hash, password, bcrypt_rounds)
+
+
+def check_password(password: str, hashed: str):
+    """Check a password against its stored hash
+
+        returns:
+            (matches, new_hash): new_hash is a hash of the password at the current
+            cost when it matched but the stored hash used an outdated one, else None
+    """
+    if not _run(_check, password, hashed):
+        return False, None
+    if needs_rehash(hashed):
+        return True, _run(_hash, password, bcrypt_rounds)
+    return True, None
+
+
+def hash_passwords(passwords: list) -> list:
+    """Hash many passwords in parallel, for seeding scripts; waits for room instead of failing"""
+    futures = []
+    for password in passwords:
+        _slots.acquire()
+        future = _executor.submit(_hash, password, bcrypt_rounds)
+        future.add_done_callback(lambda _: _slots.release())
+        futures.append(future)
+    return [future.result() for future in futures]
@@ -0,0 +1,142 @@
+"""query_audit.py: catch N+1 queries and routes that run too many statements
+
+Every SQL statement a request runs through the engine is counted by its normalized
+text (literals and parameters replaced by ?, IN lists collapsed). When a request
+ends, two things are checked:
+    the same statement ran more than sql_repeat_limit times (a query in a loop)
+    the request ran more statements than its route's budget in QUERY_BUDGETS
+Each finding is logged as a warning in debug mode and raised as
+QueryBudgetExceeded under tests (app.testing), so the test that hit the route
+fails. sql_audit=off|warn|raise overrides that; in production it is off.
+
+Tests can look at what a request ran:
+
+    with capture_queries() as requests:
+        client.get('/my_feed')
+    assert requests[0].statements <= QUERY_BUDGETS['my_feed']
+"""
+import logging
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+from flask import current_app, g, request
+
+# Load environment variables from .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# times one statement may run in a request before it counts as a query in a loop
+sql_repeat_limit = int(os.getenv('sql_repeat_limit', '5'))
+# off, warn or raise; empty picks raise under tests, warn in debug, off otherwise
+sql_audit = os.getenv('sql_audit', '')
+
+# most statements each route may run in one request
+QUERY_BUDGETS = {
+    "index": 2,
+    "login": 4,
+    "my_feed": 6,
+    "load_more_feed": 6,
+    "my_profile": 3,
+    "discover": 6,
+    "other_user_profile": 6,
+    "media_page": 8,
+    "search_users": 4,
+    "top_media": 3,
+    "media_search": 3,
+    "create_post": 5,
+}
+
+_LITERALS = re.compile(r"%\(\w+\)s|\$\d+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran a statement too many times or ran over its route's budget"""
+
+
+@dataclass
+class RequestQueries:
+    """The statements one request ran"""
+    endpoint: str
+    statements: int
+    # normalized SQL -> times it ran
+    counts: Counter = field(default_factory=Counter)
+
+    @property
+    def repeated(self) -> dict:
+        """Statements that ran more than sql_repeat_limit times"""
+        return {sql: n for sql, n in self.counts.items() if n > sql_repeat_limit}
+
+
+# lists handed out by capture_queries(); every finished request is appended to each
+_captures = []
+
+
+def normalize(statement: str) -> str:
+    """Reduce a statement to its shape so the same query with other values compares equal"""
+    statement = _LITERALS.sub("?", statement)
+    statement = _IN_LIST.sub("(...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+@contextmanager
+def capture_queries():
+    """Collect a RequestQueries for every request finished inside the block"""
+    captured = []
+    _captures.append(captured)
+    try:
+        yield captured
+    finally:
+        _captures.remove(captured)
+
+
+def _mode() -> str:
+    if sql_audit:
+        return sql_audit
+    if current_app.testing:
+        return "raise"
+    if current_app.debug:
+        return "warn"
+    return "off"
+
+
+def init_query_audit(app) -> None:
+    """Check every request of app against the repeat limit and its route's budget"""
+
+    @app.before_request
+    def start_statement_log():
+        if _captures or _mode() != "off":
+            # filled in by db.server.record_statements
+            g.sql_statement_log = Counter()
+            g.sql_statements_before = g.get('sql_statements', 0)
+
+    @app.after_request
+    def check_statement_log(response):
+        log = g.pop('sql_statement_log', None)
+        if log is None:
+            return response
+        counts = Counter()
+        for statement, n in log.items():
+            counts[normalize(statement)] += n
+        endpoint = request.endpoint or "unmatched"
+        queries = RequestQueries(endpoint, g.get('sql_statements', 0) - g.pop('sql_statements_before', 0), counts)
+        for captured in _captures:
+            captured.append(queries)
+
+        problems = [f"{n}x {sql[:200]}" for sql, n in queries.repeated.items()]
+        budget = QUERY_BUDGETS.get(endpoint)
+        if budget is not None and queries.statements > budget:
+            problems.append(f"{queries.statements} statements, budget is {budget}")
+        if problems:
+            message = f"{request.method} {request.path} ({endpoint}): " + "; ".join(problems)
+            mode = _mode()
+            if mode == "raise":
+                raise QueryBudgetExceeded(message)
+            if mode == "warn":
+                logger.warning("Query audit: %s", message)
+        return response
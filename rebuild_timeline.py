@@ -0,0 +1,24 @@
+"""rebuild_timeline.py: regenerate the precomputed feed timelines, e.g. after a bulk import"""
+
+import argparse
+from db.server import init_database
+from db.query import rebuildTimeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild feed timelines from follows and posts")
+    parser.add_argument("--user", type=int, help="only rebuild the timeline of this UserID")
+    args = parser.parse_args()
+
+    if not init_database():
+        exit(1)
+
+    count = rebuildTimeline(args.user)
+    if args.user is None:
+        print(f"Rebuilt all timelines: {count} entries")
+    else:
+        print(f"Rebuilt timeline for user {args.user}: {count} entries")
+
+
+if __name__ == "__main__":
+    main()
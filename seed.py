@@ -0,0 +1,213 @@
+"""seed.py: fill the database with a large synthetic data set, fast
+
+Generates users, titles, posts, comments, follows and watch lists from a fixed
+random seed (the same arguments give the same rows) and loads them with COPY in one
+transaction; a failed run leaves the database as it was. Follows follow a power
+law: a few users have a large share of the followers and most have a handful, and
+a few titles get most of the posts and watch list entries. Every user has the same
+password, hashed once.
+
+Rows are added after the ones already in the database; user names and emails
+carry the new UserID (user1234, user1234@seed.test), so seeding again adds new users
+instead of clashing with the last run's. Timelines and media_stats are rebuilt in
+the same transaction, since the rows bypass createPost and follow_user.
+
+usage:
+    python seed.py --users 100000
+    python seed.py --users 1000000 --follows 50 --password secret --seed 7
+"""
+import argparse
+import io
+import itertools
+import os
+import random
+import time
+from sqlalchemy import text
+from passwords import hash_password
+from db.server import init_database, engine
+from db.query import writeTimeline, WATCH_TABLES
+from db.migrate import MIGRATIONS_DIR, run_sql_file
+
+GENRES = ["Drama", "Comedy", "Sci-Fi", "Action", "Fantasy", "Horror", "Documentary", "Animation"]
+WORDS = ["great", "slow", "twist", "ending", "cast", "season", "finale", "rewatch", "classic", "overrated",
+         "pilot", "score", "villain", "plot", "episode", "binge"]
+# users whose rows are generated and copied together
+CHUNK_USERS = 20000
+# a user follows at most this many others
+MAX_FOLLOWS = 5000
+
+
+def zipf_weights(n: int, exponent: float) -> list:
+    """Cumulative weights of ranks 1..n with weight 1 / rank^exponent, for random.choices"""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+def heavy_tailed(rng: random.Random, mean: float, limit: int) -> int:
+    """A count with the given mean and a long tail (Pareto, shape 2)"""
+    return min(int(rng.paretovariate(2) * mean / 2), limit)
+
+
+def copy_rows(cursor, table: str, columns: tuple, rows: list) -> None:
+    """COPY rows (tuples of values without tabs or newlines) into table"""
+    if not rows:
+        return
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(str, row)))
+        buffer.write("\n")
+    buffer.seek(0)
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    cursor.copy_expert(f'COPY "{table}" ({column_list}) FROM STDIN', buffer)
+
+
+def drop_foreign_keys(connection, tables: list) -> list:
+    """Drop the foreign keys of tables; returns what add_foreign_keys needs to put them back
+
+    Checking a key row by row costs more than loading the row. Adding the key back
+    afterwards checks every row in one pass, and fails if one is missing.
+    """
+    keys = connection.execute(text(
+        """
+        SELECT conrelid::regclass::text AS table_name, conname, pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint
+        WHERE contype = 'f' AND conrelid = ANY(CAST(:tables AS regclass[]))
+        """), {"tables": [f'"{table}"' for table in tables]}).all()
+    for key in keys:
+        connection.execute(text(f'ALTER TABLE {key.table_name} DROP CONSTRAINT "{key.conname}"'))
+    return keys
+
+
+def add_foreign_keys(connection, keys: list) -> None:
+    for key in keys:
+        connection.execute(text(f'ALTER TABLE {key.table_name} ADD CONSTRAINT "{key.conname}" {key.definition}'))
+
+
+def next_id(connection, table: str, column: str) -> int:
+    return connection.execute(text(f'SELECT COALESCE(max("{column}"), 0) + 1 FROM "{table}"')).scalar()
+
+
+def seed_database(users: int, titles: int = None, follows: float = 20, posts: float = 3, comments: float = 2,
+                  watch: float = 5, password: str = "password123", prefix: str = "user", domain: str = "seed.test",
+                  seed: int = 42) -> dict:
+    """Generate and load the data set; users get UName <prefix><UserID> and Email <prefix><UserID>@<domain>
+
+        returns:
+            counts (dict): rows added per table
+    """
+    rng = random.Random(seed)
+    titles = titles or max(users // 20, 50)
+    hashed = hash_password(password)
+    counts = dict.fromkeys(["user", "tvmovie", "post", "creates", "comment", "makes", "follows", *WATCH_TABLES], 0)
+
+    with engine.begin() as connection:
+        first_user = next_id(connection, "user", "UserID")
+        first_media = next_id(connection, "tvmovie", "MediaID")
+        post_id = next_id(connection, "post", "PostID")
+        comment_id = next_id(connection, "comment", "CommentID")
+        # the raw DBAPI cursor, for COPY
+        cursor = connection.connection.cursor()
+        # added back (and checked) before the transaction commits; the timeline's
+        # too, since it is rebuilt from the loaded rows
+        keys = drop_foreign_keys(connection, list(counts) + ["timeline"])
+        user_ids = range(first_user, first_user + users)
+        media_ids = range(first_media, first_media + titles)
+        for start in range(0, users, CHUNK_USERS):
+            rows = [(user_id, "Seed", f"User{user_id}", f"{prefix}{user_id}", hashed, f"{prefix}{user_id}@{domain}")
+                    for user_id in user_ids[start:start + CHUNK_USERS]]
+            copy_rows(cursor, "user", ("UserID", "FName", "LName", "UName", "PWord", "Email"), rows)
+            counts["user"] += len(rows)
+        rows = [(media_id, f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {n + 1}", rng.choice(GENRES),
+                 rng.randint(1960, 2025), "Movie" if rng.random() < 0.4 else "TV")
+                for n, media_id in enumerate(media_ids)]
+        copy_rows(cursor, "tvmovie", ("MediaID", "Title", "Genre", "Year", "Type"), rows)
+        counts["tvmovie"] = len(rows)
+
+        # popularity ranks are shuffled so the popular users and titles are not simply the first ids
+        popular_users = list(user_ids)
+        rng.shuffle(popular_users)
+        user_weights = zipf_weights(users, 0.8)
+        popular_media = list(media_ids)
+        rng.shuffle(popular_media)
+        media_weights = zipf_weights(titles, 1.0)
+
+        for start in range(0, users, CHUNK_USERS):
+            post_rows, creates_rows, comment_rows, makes_rows, follows_rows = [], [], [], [], []
+            watch_rows = {table: [] for table in WATCH_TABLES}
+            for user_id in user_ids[start:start + CHUNK_USERS]:
+                for _ in range(heavy_tailed(rng, posts, 500)):
+                    date = f"20{rng.randint(22, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+                    media_id = rng.choices(popular_media, cum_weights=media_weights)[0]
+                    post_rows.append((post_id, media_id, " ".join(rng.choices(WORDS, k=3)).capitalize(), date,
+                                      " ".join(rng.choices(WORDS, k=20)), "t" if rng.random() < 0.1 else "f",
+                                      rng.randint(1, 4)))
+                    creates_rows.append((user_id, post_id))
+                    for _ in range(rng.randint(0, int(comments * 2))):
+                        comment_rows.append((comment_id, post_id, date, " ".join(rng.choices(WORDS, k=6))))
+                        makes_rows.append((rng.choice(user_ids), comment_id))
+                        comment_id += 1
+                    post_id += 1
+
+                followed = set(rng.choices(popular_users, cum_weights=user_weights,
+                                           k=heavy_tailed(rng, follows, min(MAX_FOLLOWS, users - 1))))
+                followed.discard(user_id)
+                follows_rows.extend((user_id, other) for other in followed)
+
+                for table in WATCH_TABLES:
+                    media = set(rng.choices(popular_media, cum_weights=media_weights, k=rng.randint(0, int(watch * 2))))
+                    watch_rows[table].extend((user_id, media_id) for media_id in media)
+
+            copy_rows(cursor, "post", ("PostID", "MediaID", "Title", "Date", "Content", "Spoiler", "Rating"), post_rows)
+            copy_rows(cursor, "creates", ("UserID", "PostID"), creates_rows)
+            copy_rows(cursor, "comment", ("CommentID", "PostID", "Date", "Content"), comment_rows)
+            copy_rows(cursor, "makes", ("UserID", "CommentID"), makes_rows)
+            copy_rows(cursor, "follows", ("UserID", "FollowerID"), follows_rows)
+            for table in WATCH_TABLES:
+                copy_rows(cursor, table, ("UserID", "MediaID"), watch_rows[table])
+                counts[table] += len(watch_rows[table])
+            counts["post"] += len(post_rows)
+            counts["creates"] += len(creates_rows)
+            counts["comment"] += len(comment_rows)
+            counts["makes"] += len(makes_rows)
+            counts["follows"] += len(follows_rows)
+        cursor.close()
+        counts["timeline"] = writeTimeline(connection)
+        add_foreign_keys(connection, keys)
+
+        # the rows carry explicit ids; let the app's own inserts carry on after them
+        for table, column in (("user", "UserID"), ("tvmovie", "MediaID"), ("post", "PostID"), ("comment", "CommentID")):
+            connection.execute(text(
+                f"""SELECT setval(pg_get_serial_sequence('"{table}"', '{column}'), (SELECT max("{column}") FROM "{table}"))"""))
+        # per-title rating totals, normally kept up to date by createPost
+        run_sql_file(connection, os.path.join(MIGRATIONS_DIR, '003_media_stats.sql'))
+
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the database with a large synthetic data set")
+    parser.add_argument("--users", type=int, required=True, help="users to add")
+    parser.add_argument("--titles", type=int, help="titles to add (default: one per 20 users)")
+    parser.add_argument("--follows", type=float, default=20, help="average users each user follows")
+    parser.add_argument("--posts", type=float, default=3, help="average posts per user")
+    parser.add_argument("--comments", type=float, default=2, help="average comments per post")
+    parser.add_argument("--watch", type=float, default=5, help="average titles in each of a user's watch lists")
+    parser.add_argument("--password", default="password123", help="password of every seeded user")
+    parser.add_argument("--prefix", default="user", help="user names are <prefix><UserID>")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    args = parser.parse_args()
+
+    if not init_database():
+        exit(1)
+
+    start = time.perf_counter()
+    counts = seed_database(args.users, args.titles, args.follows, args.posts, args.comments, args.watch,
+                           password=args.password, prefix=args.prefix, seed=args.seed)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s:")
+    for table, count in counts.items():
+        print(f"  {table:<10}{count:>12}")
+
+
+if __name__ == "__main__":
+    main()
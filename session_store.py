@@ -0,0 +1,250 @@
+"""session_store.py: keep track of logged in users
+
+The login cookie holds a random token. The store maps that token to a slim record of
+the user (never the password hash) and expires it after session_ttl seconds.
+
+Two backends, picked with the session_backend environment variable:
+    database (default): the user_session table, shared by every worker process,
+        at most session_max_per_user sessions per user; expired rows are purged
+        every session_purge_interval seconds
+    memory: a dict inside this process, bounded by session_max_entries (LRU)
+"""
+import hashlib
+import os
+import secrets
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from time import monotonic
+from dotenv import load_dotenv
+from sqlalchemy import text
+from db.server import get_session, PostgresSession
+
+# Load environment variables from .env
+load_dotenv()
+
+# seconds a session lives after the last time it was used
+session_ttl = int(os.getenv('session_ttl', '86400'))
+# memory backend only: most sessions kept before the least recently used is evicted
+session_max_entries = int(os.getenv('session_max_entries', '10000'))
+# database backend only: most sessions one user keeps, the oldest logged out first...
+session_max_per_user = int(os.getenv('session_max_per_user', '10'))
+# ...and seconds between purges of expired sessions, per worker process
+session_purge_interval = float(os.getenv('session_purge_interval', '300'))
+session_backend = os.getenv('session_backend', 'database')
+
+# what checkUserLogin hands to the routes
+SessionUser = namedtuple('SessionUser', ['UserID', 'UName', 'FName', 'LName', 'Email'])
+
+def slim_user(user) -> SessionUser:
+    """Copy the fields the routes need out of a User row"""
+    return SessionUser(user.UserID, user.UName, user.FName, user.LName, user.Email)
+
+def new_token() -> str:
+    """Random token for the login cookie"""
+    return secrets.token_urlsafe(32)
+
+def hash_token(token: str) -> str:
+    """Tokens are stored hashed so a leaked table can't be replayed as cookies"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class MemorySessionStore:
+    """Sessions in a dict inside this process, with TTL and LRU eviction"""
+
+    def __init__(self, ttl: int = session_ttl, max_entries: int = session_max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # token hash -> (SessionUser, expiry as a monotonic timestamp), oldest use first
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, user) -> str:
+        """Log a user in and return the token for their cookie"""
+        token = new_token()
+        with self._lock:
+            self._sessions[hash_token(token)] = (slim_user(user), monotonic() + self.ttl)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+        return token
+
+    def get(self, token: str):
+        """Return the logged in SessionUser for a token, or None"""
+        if not token:
+            return None
+        key = hash_token(token)
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            user, expires = entry
+            now = monotonic()
+            if expires < now:
+                del self._sessions[key]
+                return None
+            # sliding expiry, and mark as most recently used
+            self._sessions[key] = (user, now + self.ttl)
+            self._sessions.move_to_end(key)
+            return user
+
+    def delete(self, token: str) -> None:
+        """Log the session out"""
+        if not token:
+            return
+        with self._lock:
+            self._sessions.pop(hash_token(token), None)
+
+    def delete_user(self, userid: int) -> None:
+        """Log every session of a user out"""
+        with self._lock:
+            for key in [key for key, (user, _) in self._sessions.items() if user.UserID == userid]:
+                del self._sessions[key]
+
+
+# expired sessions deleted per statement, so a purge never holds its locks for long
+SESSION_PURGE_BATCH = 5000
+
+
+class DatabaseSessionStore:
+    """Sessions in the user_session table, shared by every worker process"""
+
+    def __init__(self, ttl: int = session_ttl, max_per_user: int = session_max_per_user,
+                 purge_interval: float = session_purge_interval):
+        self.ttl = ttl
+        self.max_per_user = max_per_user
+        self.purge_interval = purge_interval
+        self._purged_at = monotonic()
+        self._purge_lock = threading.Lock()
+
+    def purge_expired(self) -> int:
+        """Delete expired sessions, in batches on a connection of its own; returns how many"""
+        deleted = 0
+        session = PostgresSession()
+        try:
+            while True:
+                result = session.execute(text(
+                    """
+                    DELETE FROM "user_session" WHERE "TokenHash" IN (
+                        SELECT "TokenHash" FROM "user_session" WHERE "Expires" < :now LIMIT :batch)
+                    """), {"now": datetime.now(), "batch": SESSION_PURGE_BATCH})
+                session.commit()
+                deleted += result.rowcount
+                if result.rowcount < SESSION_PURGE_BATCH:
+                    return deleted
+        except Exception as e:
+            session.rollback()
+            print(f"Error purging sessions: {e}")
+            return deleted
+        finally:
+            session.close()
+
+    def _maybe_purge(self) -> None:
+        """Purge expired sessions if this process hasn't for purge_interval seconds"""
+        now = monotonic()
+        if now - self._purged_at < self.purge_interval or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._purged_at = now
+            self.purge_expired()
+        finally:
+            self._purge_lock.release()
+
+    def create(self, user) -> str:
+        """Log a user in and return the token for their cookie"""
+        self._maybe_purge()
+        token = new_token()
+        record = slim_user(user)
+        session = get_session()
+        try:
+            session.execute(text(
+                """
+                INSERT INTO "user_session" ("TokenHash", "UserID", "UName", "FName", "LName", "Email", "Expires")
+                VALUES (:token_hash, :user_id, :uname, :fname, :lname, :email, :expires)
+                """), {
+                    "token_hash": hash_token(token),
+                    "user_id": record.UserID,
+                    "uname": record.UName,
+                    "fname": record.FName,
+                    "lname": record.LName,
+                    "email": record.Email,
+                    "expires": datetime.now() + timedelta(seconds=self.ttl)
+                })
+            # the user's oldest sessions beyond max_per_user are logged out
+            session.execute(text(
+                """
+                DELETE FROM "user_session" WHERE "UserID" = :user_id AND "TokenHash" NOT IN (
+                    SELECT "TokenHash" FROM "user_session" WHERE "UserID" = :user_id
+                    ORDER BY "Expires" DESC LIMIT :keep)
+                """), {"user_id": record.UserID, "keep": self.max_per_user})
+            session.commit()
+            return token
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def get(self, token: str):
+        """Return the logged in SessionUser for a token, or None"""
+        if not token:
+            return None
+        self._maybe_purge()
+        session = get_session()
+        try:
+            now = datetime.now()
+            row = session.execute(text(
+                """
+                SELECT "UserID", "UName", "FName", "LName", "Email", "Expires"
+                FROM "user_session"
+                WHERE "TokenHash" = :token_hash AND "Expires" >= :now
+                """), {"token_hash": hash_token(token), "now": now}).first()
+            if row is None:
+                return None
+
+            # sliding expiry, written at most once per half TTL instead of on every request
+            if row.Expires - now < timedelta(seconds=self.ttl / 2):
+                session.execute(text('UPDATE "user_session" SET "Expires" = :expires WHERE "TokenHash" = :token_hash'),
+                                {"expires": now + timedelta(seconds=self.ttl), "token_hash": hash_token(token)})
+                session.commit()
+            return SessionUser(row.UserID, row.UName, row.FName, row.LName, row.Email)
+        except Exception as e:
+            session.rollback()
+            print(f"Error reading session: {e}")
+            return None
+        finally:
+            session.close()
+
+    def delete(self, token: str) -> None:
+        """Log the session out"""
+        if not token:
+            return
+        session = get_session()
+        try:
+            session.execute(text('DELETE FROM "user_session" WHERE "TokenHash" = :token_hash'), {"token_hash": hash_token(token)})
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Error deleting session: {e}")
+        finally:
+            session.close()
+
+    def delete_user(self, userid: int) -> None:
+        """Log every session of a user out"""
+        session = get_session()
+        try:
+            session.execute(text('DELETE FROM "user_session" WHERE "UserID" = :user_id'), {"user_id": userid})
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Error deleting sessions: {e}")
+        finally:
+            session.close()
+
+
+def create_session_store():
+    """Build the store selected by the session_backend environment variable"""
+    if session_backend == 'memory':
+        return MemorySessionStore()
+    if session_backend == 'database':
+        return DatabaseSessionStore()
+    raise ValueError(f"Unknown session_backend: {session_backend}")
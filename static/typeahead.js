@@ -0,0 +1,41 @@
+// typeahead.js: suggest media titles from /media/search instead of embedding the whole catalog.
+// Use on a text input with data-typeahead and a list="..." datalist, inside a form
+// with a hidden mediaid input that receives the chosen MediaID.
+document.querySelectorAll('input[data-typeahead]').forEach(function (input) {
+    var hidden = input.form.querySelector('input[name="mediaid"]');
+    var options = document.getElementById(input.getAttribute('list'));
+    var matches = {};
+    var timer = null;
+
+    function label(media) {
+        return media.Title + ' (' + media.Year + ')';
+    }
+
+    function choose() {
+        hidden.value = matches[input.value] || '';
+        input.setCustomValidity(hidden.value ? '' : 'Pick a title from the list');
+    }
+
+    input.addEventListener('input', function () {
+        choose();
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            fetch('/media/search?limit=10&q=' + encodeURIComponent(input.value))
+                .then(function (response) { return response.json(); })
+                .then(function (results) {
+                    matches = {};
+                    options.innerHTML = '';
+                    results.forEach(function (media) {
+                        var option = document.createElement('option');
+                        option.value = label(media);
+                        matches[option.value] = media.MediaID;
+                        options.appendChild(option);
+                    });
+                    choose();
+                })
+                .catch(function (error) {
+                    console.error('Error:', error);
+                });
+        }, 150);
+    });
+});
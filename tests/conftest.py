@@ -16,3 +16,22 @@ def app():
 def client(app):
     """Test client for making requests"""
     return app.test_client()
+
+@pytest.fixture
+def logged_in_client(app):
+    """Test client logged in as a throwaway user, deleted again afterwards"""
+    from uuid import uuid4
+    from sqlalchemy import text
+    from db.server import engine
+
+    client = app.test_client()
+    name = uuid4().hex[:12]
+    email = f"{name}@example.com"
+    client.post('/signup', data={'FName': 'Test', 'LName': 'User', 'UName': name,
+                                 'Email': email, 'PWord': 'password123'})
+    client.post('/login', data={'Email': email, 'PWord': 'password123'})
+    yield client
+
+    with engine.begin() as connection:
+        connection.execute(text('DELETE FROM "user_session" WHERE "UserID" IN (SELECT "UserID" FROM "user" WHERE "Email" = :email)'), {"email": email})
+        connection.execute(text('DELETE FROM "user" WHERE "Email" = :email'), {"email": email})
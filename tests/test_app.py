@@ -45,7 +45,7 @@ def test_add_to_watched_page(client):
 
 def test_remove_from_watched_page(client):
     """Test the removed_from_watched page"""
-    response = client.post('/remove_from_watched', data={'title': 'Some Title'}, follow_redirects=True)
+    response = client.post('/remove_from_watched', data={'mediaid': '1'}, follow_redirects=True)
     assert response.status_code == 200
 
 def test_valid_registration(client):
@@ -66,3 +66,244 @@ def test_valid_login(client):
         'Password': 'password123'
     }, follow_redirects=True)
     assert response.status_code == 200
+
+def test_load_more_feed_requires_login(client):
+    """Test that the load more feed API rejects anonymous users"""
+    response = client.get('/my_feed/more?before_date=2025-01-01&before_postid=1')
+    assert response.status_code == 401
+
+def test_media_search(client, logged_in_client):
+    """Test the media typeahead endpoint, which needs a logged in user"""
+    assert client.get('/media/search?q=the').status_code == 401
+    response = logged_in_client.get('/media/search?q=the&limit=5')
+    assert response.status_code == 200
+    assert isinstance(response.get_json(), list)
+    assert len(response.get_json()) <= 5
+
+def test_top_media_page(client):
+    """Test the top media page"""
+    response = client.get('/top_media')
+    assert response.status_code == 200
+    response = client.get('/top_media?sort=reviewed')
+    assert response.status_code == 200
+
+def test_search_users_requires_login(client):
+    """Test that user search redirects anonymous users to login"""
+    response = client.get('/search_users?search_term=al&page=2')
+    assert response.status_code == 302
+
+def test_pool_status(client, monkeypatch):
+    """Test the connection pool status endpoint"""
+    import metrics
+    monkeypatch.setattr(metrics, 'metrics_token', 'secret')
+    response = client.get('/pool_status', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert 'checked_out' in response.get_json()
+
+def test_internal_endpoints_need_token(client, monkeypatch):
+    """Test that /metrics and /pool_status refuse requests without the token or an allowed address"""
+    import metrics
+    monkeypatch.setattr(metrics, 'metrics_token', 'secret')
+    for path in ('/metrics', '/pool_status'):
+        assert client.get(path).status_code == 403
+        assert client.get(path, headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    monkeypatch.setattr(metrics, 'metrics_allowed_addresses', {'127.0.0.1'})
+    assert client.get('/metrics').status_code == 200
+
+def test_request_shares_one_session(app):
+    """Test that every query in a request gets the same session"""
+    from db.server import get_session
+    with app.test_request_context('/'):
+        assert get_session() is get_session()
+
+def test_not_found_page(client):
+    """Test the 404 page"""
+    response = client.get('/this-page-does-not-exist')
+    assert response.status_code == 404
+
+def test_metrics_endpoint(client, monkeypatch):
+    """Test the Prometheus metrics endpoint"""
+    import metrics
+    monkeypatch.setattr(metrics, 'metrics_token', 'secret')
+    client.get('/about')
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert 'http_requests_total{endpoint="about"' in response.get_data(as_text=True)
+
+def test_page_query_budgets(logged_in_client):
+    """Test that the main pages stay within their statement budgets and run no query in a loop"""
+    from query_audit import capture_queries, QUERY_BUDGETS
+    pages = ['/my_feed', '/my_profile', '/discover', '/media/1', '/search_users?search_term=a', '/top_media']
+    with capture_queries() as requests:
+        for page in pages:
+            assert logged_in_client.get(page).status_code == 200
+    assert [r.endpoint for r in requests] == ['my_feed', 'my_profile', 'discover', 'media_page', 'search_users', 'top_media']
+    for r in requests:
+        assert r.statements <= QUERY_BUDGETS[r.endpoint], r.endpoint
+        assert not r.repeated, r.endpoint
+
+def test_delete_account(logged_in_client):
+    """Deleting an account needs the password, then logs the user out"""
+    response = logged_in_client.post('/delete_account', data={'PWord': 'wrong'})
+    assert b"Incorrect password" in response.data
+    response = logged_in_client.post('/delete_account', data={'PWord': 'password123'})
+    assert response.status_code == 302
+    assert logged_in_client.get('/my_profile').status_code == 302
+
+def test_asset_url(app, client):
+    """Static files linked through asset_url are served, fingerprinted ones cached for good"""
+    from assets import asset_url
+    with app.test_request_context():
+        url = asset_url('loginStyle.css')
+    response = client.get(url)
+    assert response.status_code == 200
+    if url.startswith('/static/dist/'):
+        assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_response_compression(client):
+    """Pages are gzipped for clients that accept it and sent as they are to the rest"""
+    import gzip
+    plain = client.get('/about', headers={'Accept-Encoding': 'identity'})
+    compressed = client.get('/about', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == plain.data
+
+def test_media_page_fragment_cache(logged_in_client):
+    """The media page is served from cached fragments until a post or comment changes it"""
+    from query_audit import capture_queries
+    from fragment_cache import fragments
+    fragments.clear()
+    with capture_queries() as requests:
+        logged_in_client.get('/media/1')
+        logged_in_client.get('/media/1')
+    assert requests[1].statements < requests[0].statements
+    logged_in_client.post('/create_post', data={'title': 'Cache test', 'rating': '3', 'content': 'Fresh post',
+                                                'mediaid': '1'})
+    page = logged_in_client.get('/media/1').get_data(as_text=True)
+    assert 'Fresh post' in page
+    assert 'Delete Post' in page
+    # purges the post again
+    logged_in_client.post('/delete_account', data={'PWord': 'password123'})
+
+def test_templates_precompiled(app):
+    """Every template is compiled at start-up, with its bytecode cached on disk"""
+    import os
+    from warmup import precompile_templates
+    assert app.jinja_env.bytecode_cache is not None
+    assert precompile_templates(app) == len([f for f in os.listdir(app.template_folder) if f.endswith('.html')])
+
+def test_rollback_after_write_fails_request(app):
+    """A rollback that throws away the request's writes turns the response into an error"""
+    import pytest
+    from flask import Response
+    from sqlalchemy import text
+    from db.server import get_session, commit_request_session, RequestSessionFailed
+    with app.test_request_context('/'):
+        session = get_session()
+        session.execute(text('SELECT 1'))
+        session.rollback()
+        assert commit_request_session(Response()).status_code == 200
+    with app.test_request_context('/'):
+        session = get_session()
+        session.execute(text('CREATE TEMPORARY TABLE rollback_test (x INTEGER)'))
+        session.rollback()
+        with pytest.raises(RequestSessionFailed):
+            commit_request_session(Response())
+
+def test_signup_duplicate_email(client):
+    """A second signup with the same email shows the form again with an error instead of failing"""
+    from uuid import uuid4
+    from sqlalchemy import text
+    from db.server import engine
+    name = uuid4().hex[:12]
+    form = {'FName': 'Test', 'LName': 'User', 'UName': name, 'Email': f"{name}@example.com", 'PWord': 'password123'}
+    try:
+        assert client.post('/signup', data=form).status_code == 302
+        response = client.post('/signup', data=dict(form, UName=name + 'x'))
+        assert response.status_code == 200
+        assert '<title>Signup' in response.get_data(as_text=True)
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text('DELETE FROM "user" WHERE "Email" = :email'), {"email": form['Email']})
+
+def test_discover_without_async_pool(logged_in_client, monkeypatch):
+    """The discover page still loads when the concurrent queries can't reach the database"""
+    import db.async_query as async_query
+    def unreachable(*coroutines):
+        for coroutine in coroutines:
+            coroutine.close()
+        raise OSError("database unreachable")
+    monkeypatch.setattr(async_query, 'run_all', unreachable)
+    assert logged_in_client.get('/discover').status_code == 200
+
+def test_media_page_failure_not_cached(logged_in_client, monkeypatch):
+    """A media page rendered while its queries fail is shown but not cached for other viewers"""
+    import db.async_query as async_query
+    from fragment_cache import fragments
+    async def unreachable(mediaid, raise_errors=False):
+        raise OSError("database unreachable")
+    fragments.clear()
+    with monkeypatch.context() as patch:
+        patch.setattr(async_query, 'getMediaPosts', unreachable)
+        assert logged_in_client.get('/media/1').status_code == 200
+    assert len(fragments) == 0
+    assert logged_in_client.get('/media/1').status_code == 200
+    assert len(fragments) == 1
+
+def test_range_responses_not_compressed(client):
+    """A byte range is sent as it is, since Content-Range counts uncompressed bytes"""
+    response = client.get('/static/loginStyle.css', headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=0-999'})
+    assert response.status_code == 206
+    assert 'Content-Encoding' not in response.headers
+    response = client.get('/static/loginStyle.css', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Ranges' not in response.headers
+
+def test_fragment_cache_bounds():
+    """The fragment cache keeps one version per page and stays under its size limit"""
+    from fragment_cache import FragmentCache
+    cache = FragmentCache(max_bytes=100)
+    cache.set(("media_page", 1, 1, 1), "a" * 40)
+    cache.set(("media_page", 1, 2, 1), "b" * 40)
+    assert cache.get(("media_page", 1, 1, 1)) is None
+    assert cache.get(("media_page", 1, 2, 1)) == "b" * 40
+    cache.set(("media_page", 2, 1, 1), "c" * 40)
+    cache.set(("media_page", 3, 1, 1), "d" * 40)
+    assert cache.size <= 100
+    assert cache.get(("media_page", 1, 2, 1)) is None
+    cache.set(("media_page", 4, 1, 1), "e" * 200)
+    assert cache.get(("media_page", 4, 1, 1)) is None
+
+def test_log_arguments_merged_unless_primitive():
+    """Records with mutable or lazy arguments are formatted before they leave the request thread"""
+    import logging
+    import queue
+    from log_setup import DeferredQueueHandler
+    handler = DeferredQueueHandler(queue.SimpleQueue())
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, "user %s on %s", (42, "my_feed"), None)
+    assert handler.prepare(record).args == (42, "my_feed")
+    items = ["a"]
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, "items %s", (items,), None)
+    prepared = handler.prepare(record)
+    items.append("b")
+    assert prepared.getMessage() == "items ['a']"
+
+def test_database_sessions_bounded(logged_in_client):
+    """A user keeps at most session_max_per_user sessions, and expired ones are purged"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import text
+    from db.server import engine, close_request_session
+    from session_store import DatabaseSessionStore, hash_token
+    store = DatabaseSessionStore(max_per_user=2)
+    user = store.get(logged_in_client.get_cookie('userloggedin').value)
+    tokens = [store.create(user) for _ in range(3)]
+    assert store.get(tokens[0]) is None
+    assert store.get(tokens[-1]) == user
+    close_request_session()
+    with engine.begin() as connection:
+        connection.execute(text('UPDATE "user_session" SET "Expires" = :past WHERE "TokenHash" = :token_hash'),
+                           {"past": datetime.now() - timedelta(days=1), "token_hash": hash_token(tokens[-1])})
+    assert store.purge_expired() >= 1
@@ -0,0 +1,83 @@
+"""warmup.py: compile templates and open database connections before the first request
+
+Without it, every worker compiles each template the first time a page uses it and
+connects to the database on its first queries, so the first requests after a
+deploy or a scale-up are the slowest. At start-up create_app:
+    points Jinja at a bytecode cache on disk, shared by the workers running as the
+    same user, so a template is compiled once and then only loaded
+    compiles or loads every template in templates/
+    opens db_pool_min connections in the SQLAlchemy pool and the asyncpg pool
+Set warm_start=false to skip the last two, e.g. for scripts that only import the app.
+"""
+import logging
+import os
+import stat
+from time import perf_counter
+from dotenv import load_dotenv
+from jinja2 import FileSystemBytecodeCache
+from db.server import engine, db_pool_min
+from db.pool import warm_pool
+import db.async_query as async_query
+
+# Load environment variables from .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# by default Jinja's own private directory (0700, checked to belong to this user)
+template_cache_dir = os.getenv('template_cache_dir') or None
+warm_start = os.getenv('warm_start', 'true').lower() in ('1', 'true', 'yes')
+
+
+def _check_private(directory: str) -> None:
+    """Refuse a cache directory other users could write to: Jinja runs whatever bytecode it finds there"""
+    info = os.stat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"template_cache_dir {directory} must be a directory owned by this user "
+                              f"and writable by no one else")
+
+
+def init_template_cache(app, directory: str = template_cache_dir) -> None:
+    """Cache compiled templates on disk; a template that changes gets a new entry
+
+        directory (str): an explicit cache directory, e.g. one on a volume every worker
+            mounts; it must belong to this user and not be writable by anyone else.
+            None uses Jinja's private per-user directory.
+    """
+    if directory is None:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+        return
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    _check_private(directory)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def precompile_templates(app) -> int:
+    """Compile (or load from the bytecode cache) every template, so requests find them ready; returns how many"""
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def warm_pools(connections: int = db_pool_min) -> int:
+    """Open connections in both pools; returns how many the SQLAlchemy pool holds"""
+    async_query.warm_up()
+    return warm_pool(engine, connections)
+
+
+def init_warmup(app) -> None:
+    """Set up the template bytecode cache and, unless warm_start=false, warm templates and pools"""
+    init_template_cache(app)
+    if not warm_start:
+        return
+    start = perf_counter()
+    templates = precompile_templates(app)
+    try:
+        connections = warm_pools()
+    except Exception as e:
+        # the first requests will connect instead
+        logger.warning("Could not open database connections at start-up: %s", e)
+        connections = 0
+    logger.info("Warmed up in %.0f ms: %d templates, %d database connections",
+                (perf_counter() - start) * 1000, templates, connections)